@@ -1,6 +1,38 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from api.authentication import invalidate_token, invalidate_user_tokens
+        from api.caching import (invalidate_author, invalidate_recipe,
+                                 invalidate_recipe_ingredient,
+                                 invalidate_recipe_tags)
+        from api.metrics import install_query_recorder, instrument_serializers
+
+        from api_foodgram.db import check_connections, mark_connections_idle
+        from recipes.models import Recipe, RecipeIngredient
+
+        for signal in (post_save, post_delete):
+            signal.connect(invalidate_recipe, sender=Recipe)
+            signal.connect(invalidate_recipe_ingredient,
+                           sender=RecipeIngredient)
+            signal.connect(invalidate_author, sender=get_user_model())
+        post_delete.connect(invalidate_token, sender=Token)
+        post_save.connect(invalidate_user_tokens, sender=get_user_model())
+        m2m_changed.connect(invalidate_recipe_tags,
+                            sender=Recipe.tags.through)
+        request_started.connect(check_connections)
+        request_finished.connect(mark_connections_idle)
+        if settings.METRICS_ENABLED:
+            connection_created.connect(install_query_recorder)
+            instrument_serializers()
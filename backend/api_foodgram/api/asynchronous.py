@@ -0,0 +1,101 @@
+from contextlib import nullcontext
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.routers import DefaultRouter
+
+from api.middleware import query_budget, query_budget_applies
+from api_foodgram.db import check_connections, mark_connections_idle
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        # The pool thread has its own connection, which the wrapper
+        # installed by QueryBudgetMiddleware does not see.
+        budget = (query_budget(request) if query_budget_applies(request)
+                  else nullcontext())
+        with budget:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+        mark_connections_idle()
+
+
+def async_view(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view,
+            thread_sensitive=request.method not in SAFE_METHODS,
+        )(view, request, *args, **kwargs)
+    return wrapper
+
+
+def sync_only(method):
+    # Streaming responses read the database while the body is sent, so
+    # they have to stay in the thread that ran the view.
+    method.sync_only = True
+    return method
+
+
+def is_sync_only(callback):
+    actions = getattr(callback, 'actions', None) or {}
+    return any(
+        getattr(getattr(callback.cls, action, None), 'sync_only', False)
+        for action in actions.values())
+
+
+class AsyncReadRouter(DefaultRouter):
+    def get_urls(self):
+        urls = super().get_urls()
+        if settings.ASYNC_READ_VIEWS:
+            for url in urls:
+                if not is_sync_only(url.callback):
+                    url.callback = async_view(url.callback)
+        return urls
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        # Django 3.2 iterates streaming responses inside the event loop,
+        # where the ORM is not allowed, so every part is read in the thread
+        # that ran the view.
+        headers = [
+            (header.encode('ascii'), value.encode('latin1'))
+            for header, value in response.items()
+        ] + [
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        ]
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = iter(response)
+        end = object()
+        next_part = sync_to_async(next, thread_sensitive=True)
+        try:
+            part = await next_part(parts, end)
+            while part is not end:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+                part = await next_part(parts, end)
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
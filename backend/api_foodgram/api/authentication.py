@@ -0,0 +1,91 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LocalTokenCache:
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + self.timeout, copy.copy(user), token)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+
+class SharedTokenCache:
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    @staticmethod
+    def cache_key(key):
+        return 'auth-token:{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        return self.cache.get(self.cache_key(key))
+
+    def set(self, key, user, token):
+        self.cache.set(self.cache_key(key), (user, token), self.timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.cache_key(key) for key in keys])
+
+
+if settings.TOKEN_CACHE_LOCAL:
+    # Revoking a token only reaches the cache of the current process, so
+    # this mode is for a single worker.
+    token_cache = LocalTokenCache(
+        settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT)
+else:
+    token_cache = SharedTokenCache(
+        settings.TOKEN_CACHE_ALIAS, settings.TOKEN_CACHE_TIMEOUT)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
+
+
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.delete_many([instance.key])
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.delete_many(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
@@ -0,0 +1,179 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from api_foodgram.db import use_primary
+from recipes.catalogue import get_version
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Subscription
+
+MAX_RENDERED_PAYLOADS = 256
+
+
+class RenderedPayloadCache:
+    def __init__(self, max_entries=MAX_RENDERED_PAYLOADS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, payload):
+        with self.lock:
+            self.entries[key] = (version, payload)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+catalogue_cache = RenderedPayloadCache()
+
+
+class CatalogueCacheMixin:
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return view(request, *args, **kwargs)
+        model = self.queryset.model
+        version = get_version(model)
+        key = f'{model._meta.label_lower}:{request.get_full_path()}'
+        etag = '"{}"'.format(
+            hashlib.md5(f'{key}:{version}'.encode()).hexdigest())
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        payload = catalogue_cache.get(key, version)
+        if payload is None:
+            with use_primary():
+                response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            payload = renderer.render(response.data)
+            catalogue_cache.set(key, version, payload)
+        response = HttpResponse(payload, content_type=renderer.media_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+def recipe_cache_key(pk):
+    return 'recipe:{}:{}:{}'.format(
+        pk, get_version(Tag), get_version(Ingredient))
+
+
+def author_cache_key(pk):
+    return f'recipe-author:{pk}'
+
+
+def delete_on_commit(cache_key, ids):
+    ids = list(ids)
+    transaction.on_commit(
+        lambda: cache.delete_many([cache_key(pk) for pk in ids]))
+
+
+def invalidate_recipe(sender, instance, **kwargs):
+    delete_on_commit(recipe_cache_key, [instance.pk])
+
+
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    delete_on_commit(recipe_cache_key, [instance.recipe_id])
+
+
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        delete_on_commit(recipe_cache_key, [instance.pk])
+    elif pk_set:
+        delete_on_commit(recipe_cache_key, pk_set)
+
+
+def invalidate_author(sender, instance, **kwargs):
+    delete_on_commit(author_cache_key, [instance.pk])
+
+
+class RecipeCacheMixin:
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        recipe = cache.get(recipe_cache_key(pk))
+        author = recipe and cache.get(author_cache_key(recipe['author']))
+        if author is None:
+            with use_primary():
+                instance = self.get_object()
+                data = self.get_serializer_class()(instance).data
+            recipe, author, flags = self.split_representation(data)
+            cache.set_many(
+                {recipe_cache_key(instance.pk): recipe,
+                 author_cache_key(author['id']): author},
+                settings.RECIPE_CACHE_TIMEOUT,
+            )
+        else:
+            flags = self.get_user_flags(pk)
+        return Response(self.merge_representation(recipe, author, flags))
+
+    def split_representation(self, data):
+        data = dict(data)
+        author = dict(data['author'])
+        flags = {
+            'is_subscribed': author.pop('is_subscribed'),
+            'is_favorited': data.pop('is_favorited'),
+            'is_in_shopping_cart': data.pop('is_in_shopping_cart'),
+        }
+        data['author'] = author['id']
+        return data, author, flags
+
+    def get_user_flags(self, pk):
+        user = self.request.user
+        if not user.is_authenticated:
+            return {
+                'is_subscribed': False,
+                'is_favorited': False,
+                'is_in_shopping_cart': False,
+            }
+        flags = Recipe.objects.filter(pk=pk).with_user_flags(user).annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, subscribe=OuterRef('author'))),
+        ).values(
+            'is_subscribed', 'is_favorited', 'is_in_shopping_cart',
+        ).first()
+        if flags is None:
+            raise Http404
+        return flags
+
+    def merge_representation(self, recipe, author, flags):
+        data = dict(recipe)
+        data['author'] = dict(author, is_subscribed=flags['is_subscribed'])
+        if data['image']:
+            data['image'] = self.request.build_absolute_uri(data['image'])
+        data['image_variants'] = {
+            width: self.request.build_absolute_uri(url)
+            for width, url in data['image_variants'].items()
+        }
+        data['is_favorited'] = flags['is_favorited']
+        data['is_in_shopping_cart'] = flags['is_in_shopping_cart']
+        return data
@@ -1,8 +1,9 @@
 import django_filters
 import django_filters.rest_framework as filters
-from django.db.models import Q
 
-from recipes.models import Recipe, Ingredient
+from recipes.autocomplete import autocomplete
+from recipes.models import POPULAR_ORDERING, Recipe, Ingredient
+from recipes.search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
@@ -11,6 +12,11 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
@@ -27,11 +33,17 @@ class RecipeFilter(filters.FilterSet):
                 shopping_cart_recipe__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*POPULAR_ORDERING)
+
 
 class IngredientNameFilter(django_filters.Filter):
     def filter(self, qs, value):
         if value:
-            return qs.filter(Q(name__istartswith=value))
+            return autocomplete(qs, value)
         return qs
 
 
@@ -0,0 +1,285 @@
+import gc
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from api.serializers import (CustomUserSerializer, ReadRecipeSerializer,
+                             SubscriptionSerializer)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, attach_read_rows)
+from users.models import Subscription
+
+User = get_user_model()
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmarks' / (
+    'serializers.json')
+SIZES = (1, 10, 100, 1000)
+REPEAT = 7
+TIME_THRESHOLD = 0.5
+QUERY_THRESHOLD = 0
+MIN_TIME_DELTA = 0.0005
+CALIBRATION_ROUNDS = 200000
+MIN_MEASUREMENT = 0.05
+RETRIES = 2
+AUTHORS = max(SIZES)
+RECIPES_PER_AUTHOR = 3
+INGREDIENTS = 50
+INGREDIENTS_PER_RECIPE = 8
+TAGS = 3
+PREFIX = 'benchmark'
+
+
+def calibrate():
+    started = time.perf_counter()
+    for index in range(CALIBRATION_ROUNDS):
+        item = {'id': index, 'name': str(index), 'tags': [index] * 3}
+        dict(item, amount=float(index))
+    return time.perf_counter() - started
+
+
+def build_fixture():
+    viewer = User.objects.create(
+        username=f'{PREFIX}-viewer', email=f'{PREFIX}-viewer@example.com',
+        first_name='Benchmark', last_name='Viewer')
+    Tag.objects.bulk_create(
+        Tag(name=f'{PREFIX}-{index}', color=f'#{index:06X}',
+            slug=f'{PREFIX}-{index}')
+        for index in range(TAGS))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'{PREFIX}-{index}', measurement_unit='г')
+        for index in range(INGREDIENTS))
+    User.objects.bulk_create(
+        User(username=f'{PREFIX}-{index}',
+             email=f'{PREFIX}-{index}@example.com',
+             first_name='Benchmark', last_name=str(index),
+             recipes_count=RECIPES_PER_AUTHOR, followers_count=1)
+        for index in range(AUTHORS))
+    tags = list(Tag.objects.filter(slug__startswith=PREFIX).order_by('pk'))
+    ingredients = list(Ingredient.objects.filter(
+        name__startswith=PREFIX).order_by('pk'))
+    authors = list(User.objects.filter(
+        username__startswith=f'{PREFIX}-').exclude(pk=viewer.pk)
+        .order_by('pk'))
+    Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'{PREFIX} {author.pk} {index}',
+               text='Benchmark recipe. ' * 10,
+               image=f'recipes/{PREFIX}.jpg',
+               image_variants={
+                   str(width): f'recipes/variants/{PREFIX}-{width}.webp'
+                   for width in (320, 640, 1280)},
+               cooking_time=index + 10)
+        for author in authors
+        for index in range(RECIPES_PER_AUTHOR))
+    recipes = list(Recipe.objects.filter(author__in=authors).order_by('pk'))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient=ingredients[(position + step * 7) % INGREDIENTS],
+            amount=step + 1)
+        for position, recipe in enumerate(recipes)
+        for step in range(INGREDIENTS_PER_RECIPE))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tags[(position + step) % TAGS])
+        for position, recipe in enumerate(recipes)
+        for step in range(2))
+    Subscription.objects.bulk_create(
+        Subscription(user=viewer, subscribe=author) for author in authors)
+    Favorite.objects.bulk_create(
+        Favorite(user=viewer, recipe=recipe) for recipe in recipes[::2])
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=viewer, recipe=recipe) for recipe in recipes[::3])
+    return viewer
+
+
+def read_recipes(viewer, size):
+    return attach_read_rows(list(
+        Recipe.objects.for_read(viewer)
+        .filter(name__startswith=PREFIX).order_by('-pk')[:size]))
+
+
+def subscriptions(viewer, size):
+    return list(
+        Subscription.objects.filter(user=viewer).order_by('-id')
+        .prefetch_related(
+            Prefetch('subscribe',
+                     queryset=User.objects.with_is_subscribed(viewer)),
+            Prefetch('subscribe__recipe_author',
+                     queryset=Recipe.objects.latest_per_author(
+                         RECIPES_PER_AUTHOR)),
+        )[:size])
+
+
+def users(viewer, size):
+    return list(User.objects.with_is_subscribed(viewer)
+                .filter(username__startswith=f'{PREFIX}-')
+                .exclude(pk=viewer.pk)[:size])
+
+
+BENCHMARKS = {
+    'ReadRecipeSerializer': (ReadRecipeSerializer, read_recipes),
+    'SubscriptionSerializer': (SubscriptionSerializer, subscriptions),
+    'CustomUserSerializer': (CustomUserSerializer, users),
+}
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время сериализации и число SQL-запросов для '
+            'сериализаторов списков и сравнивает их с базовыми значениями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=lambda value: [int(size) for size in value.split(',')],
+            default=SIZES,
+            help='Размеры списков через запятую.',
+        )
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument(
+            '--baseline',
+            type=Path,
+            default=BASELINE,
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Записать результаты как новые базовые значения.',
+        )
+        parser.add_argument(
+            '--time-threshold',
+            type=float,
+            default=TIME_THRESHOLD,
+            help='Допустимое замедление, доля от базового времени.',
+        )
+        parser.add_argument(
+            '--query-threshold',
+            type=int,
+            default=QUERY_THRESHOLD,
+            help='Допустимый рост числа SQL-запросов.',
+        )
+
+    def handle(self, *args, **options):
+        if max(options['sizes']) > AUTHORS:
+            raise CommandError(f'Размер списка не больше {AUTHORS}.')
+        self.repeat = options['repeat']
+        self.time_threshold = options['time_threshold']
+        self.query_threshold = options['query_threshold']
+        baseline = {}
+        if not options['update'] and options['baseline'].exists():
+            baseline = json.loads(options['baseline'].read_text())
+        with transaction.atomic():
+            results = self.run(options['sizes'], baseline)
+            transaction.set_rollback(True)
+        if options['update']:
+            options['baseline'].parent.mkdir(parents=True, exist_ok=True)
+            options['baseline'].write_text(
+                json.dumps(results, indent=4, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые значения записаны в {options["baseline"]}.'))
+            return
+        regressions = self.report(results, baseline)
+        if regressions:
+            raise CommandError(
+                f'Регрессий: {regressions}. Если замедление ожидаемо, '
+                'обновите базовые значения через --update.')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def run(self, sizes, baseline):
+        self.viewer = build_fixture()
+        request = Request(RequestFactory().get('/api/'))
+        request.user = self.viewer
+        self.context = {'request': request}
+        results = {'calibration': statistics.median(
+            calibrate() for _ in range(self.repeat))}
+        for name in BENCHMARKS:
+            results[name] = {
+                str(size): self.measure(name, size) for size in sizes}
+        for _ in range(RETRIES):
+            slower = [
+                (name, size)
+                for name, size, expected in self.points(results, baseline)
+                if self.is_slower(results[name][size], expected)
+            ]
+            for name, size in slower:
+                result = self.measure(name, int(size))
+                if result['seconds'] < results[name][size]['seconds']:
+                    results[name][size] = result
+        return results
+
+    def measure(self, name, size):
+        serializer_class, load = BENCHMARKS[name]
+        instances = load(self.viewer, size)
+        with CaptureQueriesContext(connection) as queries:
+            serializer_class(instances, many=True, context=self.context).data
+        loops = 1
+        while self.time(serializer_class, instances, loops) < MIN_MEASUREMENT:
+            loops *= 2
+        return {
+            'seconds': statistics.median(
+                self.time(serializer_class, instances, loops)
+                for _ in range(self.repeat)) / loops,
+            'queries': len(queries),
+        }
+
+    def time(self, serializer_class, instances, loops):
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(loops):
+                serializer_class(
+                    instances, many=True, context=self.context).data
+            return time.perf_counter() - started
+        finally:
+            gc.enable()
+
+    def points(self, results, baseline):
+        scale = 1
+        if baseline.get('calibration'):
+            scale = results['calibration'] / baseline['calibration']
+        for name in BENCHMARKS:
+            for size in results[name]:
+                expected = baseline.get(name, {}).get(size)
+                if expected is not None:
+                    expected = dict(
+                        expected, seconds=expected['seconds'] * scale)
+                yield name, size, expected
+
+    def is_slower(self, result, expected):
+        return expected is not None and (
+            result['seconds'] > expected['seconds'] * (
+                1 + self.time_threshold)
+            and result['seconds'] - expected['seconds'] > MIN_TIME_DELTA)
+
+    def has_more_queries(self, result, expected):
+        return expected is not None and (
+            result['queries'] > expected['queries'] + self.query_threshold)
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f'{"сериализатор":<24} {"N":>5} {"мс":>9} {"база, мс":>9} '
+            f'{"Δ":>7} {"SQL":>4} {"база":>5}')
+        regressions = 0
+        for name, size, expected in self.points(results, baseline):
+            result = results[name][size]
+            line = f'{name:<24} {size:>5} {result["seconds"] * 1000:>9.2f} '
+            if expected is None:
+                self.stdout.write(line + 'нет базового значения')
+                continue
+            change = result['seconds'] / expected['seconds'] - 1
+            line += (f'{expected["seconds"] * 1000:>9.2f} {change:>+7.0%} '
+                     f'{result["queries"]:>4} {expected["queries"]:>5}')
+            if (self.is_slower(result, expected)
+                    or self.has_more_queries(result, expected)):
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + '  регрессия'))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,279 @@
+import json
+import os
+from bisect import bisect_left
+from contextvars import ContextVar
+from glob import glob
+from threading import Lock, Timer
+from time import perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = (
+                self.values.get(label_values, 0) + amount)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def merge(self, values, label_values, value):
+        values[label_values] = values.get(label_values, 0) + value
+
+    def samples(self, values):
+        for label_values, value in values.items():
+            yield self.name, zip(self.label_names, label_values), value
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names, buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                label_values: [list(counts), total]
+                for label_values, (counts, total) in self.values.items()
+            }
+
+    def merge(self, values, label_values, value):
+        counts, total = value
+        series = values.get(label_values)
+        if series is None:
+            values[label_values] = [list(counts), total]
+            return
+        series[0] = [a + b for a, b in zip(series[0], counts)]
+        series[1] += total
+
+    def samples(self, values):
+        bounds = [str(bucket) for bucket in self.buckets] + ['+Inf']
+        for label_values, (counts, total) in values.items():
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket', labels + [('le', bound)],
+                       cumulative)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'Количество запросов к API.',
+    ('view', 'method', 'status'),
+)
+LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса.',
+    ('view', 'method'),
+    LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_http_response_size_bytes',
+    'Размер тела ответа.',
+    ('view', 'method'),
+    SIZE_BUCKETS,
+)
+QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов на один запрос к API.',
+    ('view', 'method'),
+    QUERY_BUCKETS,
+)
+SQL_TIME = Counter(
+    'foodgram_db_query_duration_seconds_total',
+    'Суммарное время SQL-запросов.',
+    ('view', 'method'),
+)
+SERIALIZER_TIME = Counter(
+    'foodgram_serializer_duration_seconds_total',
+    'Суммарное время сериализации ответов.',
+    ('view', 'method'),
+)
+METRICS = (REQUESTS, LATENCY, RESPONSE_SIZE, QUERIES, SQL_TIME,
+           SERIALIZER_TIME)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0
+        self.serializer_time = 0
+        self.serializing = False
+
+
+def record_query(execute, sql, params, many, context):
+    state = current_request.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.queries += 1
+        state.sql_time += perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def timed_data(data):
+    def wrapper(self):
+        state = current_request.get()
+        if state is None or state.serializing:
+            return data.fget(self)
+        state.serializing = True
+        started = perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            state.serializing = False
+            state.serializer_time += perf_counter() - started
+    wrapper.timed = True
+    return property(wrapper)
+
+
+def instrument_serializers():
+    for serializer_class in (serializers.Serializer,
+                             serializers.ListSerializer):
+        if not getattr(serializer_class.data.fget, 'timed', False):
+            serializer_class.data = timed_data(serializer_class.data)
+
+
+# Every worker writes its metrics to its own file in
+# METRICS_MULTIPROCESS_DIR and the worker that serves a scrape sums all of
+# them, so the numbers do not depend on which worker answered.
+class SnapshotWriter:
+    def __init__(self):
+        self.lock = Lock()
+        self.timer = None
+
+    def path(self):
+        return os.path.join(
+            settings.METRICS_MULTIPROCESS_DIR, f'{os.getpid()}.json')
+
+    def schedule(self):
+        if not settings.METRICS_MULTIPROCESS_DIR:
+            return
+        with self.lock:
+            if self.timer is not None:
+                return
+            self.timer = Timer(settings.METRICS_FLUSH_INTERVAL, self.write)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def write(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+        data = {
+            metric.name: [
+                [list(label_values), value]
+                for label_values, value in metric.snapshot().items()
+            ]
+            for metric in METRICS
+        }
+        path = self.path()
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(data, file)
+        os.replace(f'{path}.tmp', path)
+
+
+snapshot_writer = SnapshotWriter()
+
+
+def collect_metrics():
+    if not settings.METRICS_MULTIPROCESS_DIR:
+        return {metric.name: metric.snapshot() for metric in METRICS}
+    snapshot_writer.write()
+    collected = {metric.name: {} for metric in METRICS}
+    for path in glob(os.path.join(
+            settings.METRICS_MULTIPROCESS_DIR, '*.json')):
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for metric in METRICS:
+            for label_values, value in data.get(metric.name, ()):
+                metric.merge(
+                    collected[metric.name], tuple(label_values), value)
+    return collected
+
+
+def record_request(request, response, elapsed, state):
+    match = request.resolver_match
+    labels = (match.view_name if match else 'unmatched', request.method)
+    REQUESTS.inc(labels + (str(response.status_code),))
+    LATENCY.observe(labels, elapsed)
+    QUERIES.observe(labels, state.queries)
+    SQL_TIME.inc(labels, state.sql_time)
+    SERIALIZER_TIME.inc(labels, state.serializer_time)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(labels, len(response.content))
+    snapshot_writer.schedule()
+
+
+def render_metrics():
+    collected = collect_metrics()
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples(collected[metric.name]):
+            lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,119 @@
+import hashlib
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connection
+from rest_framework.permissions import SAFE_METHODS
+
+from api.metrics import RequestMetrics, current_request, record_request
+from api_foodgram.db import read_from_replica
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget_applies(request):
+    return bool(settings.QUERY_BUDGET) and request.path.startswith('/api/')
+
+
+@contextmanager
+def query_budget(request):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield
+    budget = settings.QUERY_BUDGET
+    if counter.count > budget:
+        message = (
+            f'{request.method} {request.path}: {counter.count} SQL '
+            f'queries, budget is {budget}'
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceededError(message)
+        logger.warning(message)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not query_budget_applies(request):
+            return self.get_response(request)
+        with query_budget(request):
+            return self.get_response(request)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        state = RequestMetrics()
+        token = current_request.set(state)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        record_request(request, response, perf_counter() - started, state)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        # The read-your-writes pin set by one worker has to be visible to
+        # the worker that serves the next read.
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                'Чтение с реплик требует общего кэша: задайте '
+                'CACHE_BACKEND и CACHE_LOCATION.')
+        self.get_response = get_response
+        self.sticky_seconds = settings.DB_REPLICA_STICKY_SECONDS
+
+    def get_sticky_key(self, request):
+        credential = request.META.get('HTTP_AUTHORIZATION') or (
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        if not credential:
+            return None
+        return 'db-primary:{}'.format(
+            hashlib.sha256(credential.encode()).hexdigest())
+
+    def __call__(self, request):
+        sticky_key = self.get_sticky_key(request)
+        if request.method in SAFE_METHODS:
+            use_replica = not (sticky_key and cache.get(sticky_key))
+        else:
+            use_replica = False
+            if sticky_key:
+                cache.set(sticky_key, True, self.sticky_seconds)
+        token = read_from_replica.set(use_replica)
+        try:
+            return self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
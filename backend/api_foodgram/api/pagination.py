@@ -0,0 +1,169 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.models import POPULAR_ORDERING, TimelineEntry
+
+MAX_PAGE_SIZE = 100
+
+
+def get_limit(request):
+    limit = request.query_params.get('limit', '')
+    if not limit.isdigit() or int(limit) == 0:
+        return api_settings.PAGE_SIZE
+    return min(int(limit), MAX_PAGE_SIZE)
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.limit = get_limit(request)
+        position, reverse = self.decode_cursor(request)
+        results = self.fetch(queryset, position, self.get_ordering(reverse))
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.results = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.results:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def fetch(self, queryset, position, ordering):
+        return list(self.slice(queryset, position, ordering))
+
+    def slice(self, queryset, position, ordering):
+        queryset = queryset.order_by(*(
+            f'-{name}' if descending else name
+            for name, descending in ordering
+        ))
+        if position is not None:
+            queryset = queryset.filter(self.after(position, ordering))
+        return queryset[:self.limit + 1]
+
+    def get_ordering(self, reverse):
+        ordering = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            ordering.append((name.lstrip('-'), descending != reverse))
+        return ordering
+
+    def after(self, position, ordering):
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(ordering, position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, instance, reverse):
+        position = [
+            self.model._meta.get_field(name.lstrip('-')).value_to_string(
+                instance)
+            for name in self.ordering
+        ]
+        token = urlsafe_b64encode(
+            json.dumps({'p': position, 'r': reverse}).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(token.encode()))
+            position = [
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, cursor['p'])
+            ]
+            reverse = bool(cursor['r'])
+        except (BinasciiError, ValueError, TypeError, KeyError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('ordering') == 'popular':
+            self.ordering = POPULAR_ORDERING
+        return super().paginate_queryset(queryset, request, view)
+
+
+class FeedKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.sources = TimelineEntry.objects.feed_sources(request.user)
+        return super().paginate_queryset(queryset, request, view)
+
+    def fetch(self, queryset, position, ordering):
+        keys = set()
+        for source, fields in self.sources:
+            source_ordering = [
+                (field, descending)
+                for field, (name, descending) in zip(fields, ordering)
+            ]
+            keys.update(self.slice(
+                source.values_list(*fields), position, source_ordering))
+        keys = sorted(keys, reverse=ordering[0][1])[:self.limit + 1]
+        recipes = queryset.in_bulk([pk for pub_date, pk in keys])
+        return [recipes[pk] for pub_date, pk in keys if pk in recipes]
+
+
+class KeysetPaginationMixin:
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.GET:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -0,0 +1,41 @@
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+FLOAT_EXPONENT = re.compile(rb'\de[-\d]')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def __init__(self):
+        self.encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=(',', ':'),
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if data is None or indent is not None or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if not self.ensure_ascii:
+            content = self.render_orjson(data)
+            if content is not None:
+                return content
+        content = self.encoder.encode(data)
+        return content.replace('\u2028', '\\u2028').replace(
+            '\u2029', '\\u2029').encode()
+
+    def render_orjson(self, data):
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return None
+        if FLOAT_EXPONENT.search(content):
+            return None
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
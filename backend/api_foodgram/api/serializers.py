@@ -1,16 +1,70 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.caching import delete_on_commit, recipe_cache_key
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag,
+                            TimelineEntry)
+from recipes.images import schedule_image_variants
 from users.models import Subscription
 
 User = get_user_model()
 
 
+def image_url(image, request):
+    if not image:
+        return None
+    try:
+        url = image.url
+    except AttributeError:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_variant_urls(variants, request):
+    urls = {}
+    for width, name in variants.items():
+        url = default_storage.url(name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[width] = url
+    return urls
+
+
+def tag_representations(recipe):
+    rows = getattr(recipe, 'tag_rows', None)
+    if rows is None:
+        rows = recipe.tags.values_list('id', 'name', 'color', 'slug')
+    return [
+        {'id': tag_id, 'name': name, 'color': color, 'slug': slug}
+        for tag_id, name, color, slug in rows
+    ]
+
+
+def ingredient_representations(recipe):
+    rows = getattr(recipe, 'ingredient_rows', None)
+    if rows is None:
+        rows = recipe.recipe_ingredients.values_list(
+            'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount')
+    return [
+        {
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': int(amount),
+        }
+        for ingredient_id, name, measurement_unit, amount in rows
+    ]
+
+
 class UserRegSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
         fields = (
@@ -38,7 +92,19 @@ class CustomUserSerializer(serializers.ModelSerializer):
         )
         model = User
 
+    def to_representation(self, instance):
+        return {
+            'email': instance.email,
+            'id': instance.id,
+            'username': instance.username,
+            'first_name': instance.first_name,
+            'last_name': instance.last_name,
+            'is_subscribed': self.get_is_subscribed(instance),
+        }
+
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is not None:
             current_user = request.user
@@ -64,17 +130,12 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
         model = Ingredient
 
-
-class ReadRecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='ingredient.id')
-    name = serializers.ReadOnlyField(source='ingredient.name', read_only=True)
-    measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit', read_only=True)
-    amount = serializers.IntegerField()
-
-    class Meta:
-        fields = ('id', 'name', 'measurement_unit', 'amount')
-        model = RecipeIngredient
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'measurement_unit': instance.measurement_unit,
+        }
 
 
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
@@ -89,9 +150,8 @@ class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
 class CreateRecipeSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
     )
     ingredients = CreateRecipeIngredientSerializer(
         many=True,
@@ -112,61 +172,102 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
+    @staticmethod
+    def merge_ingredients(ingredients):
+        amounts = {}
+        for ingredient in ingredients:
+            ingredient_id = ingredient['id']
+            amounts[ingredient_id] = (
+                amounts.get(ingredient_id, 0) + ingredient['amount'])
+        return amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         current_user = self.context['request'].user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data, author=current_user)
-        ingredient_counts = {}
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            amount = ingredient['amount']
-            if ingredient_id in ingredient_counts:
-                ingredient_counts[ingredient_id] += amount
-            else:
-                recipe_ingredient, created = (
-                    RecipeIngredient.objects.get_or_create(
-                        recipe=recipe,
-                        ingredient_id=ingredient_id,
-                        defaults={'amount': amount},
-                    )
-                )
-                if not created:
-                    recipe_ingredient.amount += amount
-                    recipe_ingredient.save()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in self.merge_ingredients(
+                ingredients).items()
+        )
         recipe.tags.set(tags)
+        User.objects.filter(pk=current_user.pk).bump_counter(
+            'recipes_count', 1)
+        TimelineEntry.objects.publish(recipe)
+        schedule_image_variants(recipe.pk)
+        delete_on_commit(recipe_cache_key, [recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredient.clear()
-        ingredient_counts = {}
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            amount = ingredient['amount']
-            if ingredient_id in ingredient_counts:
-                ingredient_counts[ingredient_id] += amount
-            else:
-                ingredient_counts[ingredient_id] = amount
-        create_ingredients = [
+        amounts = self.merge_ingredients(validated_data.pop('ingredients'))
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in instance.recipe_ingredients.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        removed = set(current) - set(amounts)
+        if removed:
+            instance.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=instance,
                 ingredient_id=ingredient_id,
                 amount=amount
             )
-            for ingredient_id, amount in ingredient_counts.items()
-        ]
-        RecipeIngredient.objects.bulk_create(create_ingredients)
-        instance.save()
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+        instance.tags.set(tags)
+        cart_users = list(instance.shopping_cart_recipe.values_list(
+            'user_id', flat=True))
+        if cart_users:
+            ShoppingListItem.objects.remove_recipe(cart_users, old_amounts)
+            ShoppingListItem.objects.add_recipe(cart_users, amounts)
+        old_image = instance.image.name
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        if instance.image.name != old_image:
+            instance.image_variants = {}
+            instance.save(update_fields=['image_variants'])
+            schedule_image_variants(instance.pk)
+        # Bulk writes to the ingredients and save(update_fields=[]) send no
+        # signals, so the cached payload is dropped here explicitly.
+        delete_on_commit(recipe_cache_key, [instance.pk])
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.for_read(
+            self.context['request'].user).get(pk=instance.pk)
         return ReadRecipeSerializer(instance, context=self.context).data
 
+    def validate_tags(self, value):
+        tags = Tag.objects.in_bulk(value)
+        missing = set(value) - set(tags)
+        if missing:
+            raise serializers.ValidationError(
+                f'Тэги не найдены: {sorted(missing)}')
+        return list(tags.values())
+
     def validate(self, data):
         if data.get('cooking_time') < 1:
             raise serializers.ValidationError(
@@ -183,57 +284,62 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             if ingredient.get('amount') < 0:
                 raise serializers.ValidationError(
                     'Количество ингредиентов должно быть не меньше одного!')
+        ingredient_ids = {ingredient['id'] for ingredient in ingredients}
+        missing = ingredient_ids - set(Ingredient.objects.filter(
+            id__in=ingredient_ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}')
         return data
 
 
 class ReadRecipeSerializer(serializers.ModelSerializer):
 
-    ingredients = ReadRecipeIngredientSerializer(
-        source='recipe_ingredients',
-        many=True,
-        read_only=True,
-    )
-    tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request:
-            current_user = request.user
-            if current_user.is_authenticated:
-                return Favorite.objects.filter(
-                    user=current_user, recipe=obj.id).exists()
-            return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return self._user_has(Favorite, obj)
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return self._user_has(ShoppingCart, obj)
+
+    def to_representation(self, instance):
         request = self.context.get('request')
-        if request:
-            current_user = request.user
-            if current_user.is_authenticated:
-                return ShoppingCart.objects.filter(
-                    user=current_user, recipe=obj.id).exists()
-            return False
+        return {
+            'id': instance.id,
+            'tags': tag_representations(instance),
+            'ingredients': ingredient_representations(instance),
+            'author': self.fields['author'].to_representation(
+                instance.author),
+            'name': instance.name,
+            'image': image_url(instance.image, request),
+            'image_variants': image_variant_urls(
+                instance.image_variants, request),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+        }
+
+    def _user_has(self, model, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return model.objects.filter(
+                user=request.user, recipe=obj.id).exists()
+        return False
 
     class Meta:
         model = Recipe
+        # Tags, ingredients and image variants are built from plain rows in
+        # to_representation and have no serializer fields.
         fields = (
             'id',
-            'tags',
-            'ingredients',
-            'author',
-            'name',
-            'image',
-            'text',
-            'cooking_time',
-            'is_favorited',
-            'is_in_shopping_cart',
-        )
-        read_only_fields = (
-            'id',
-            'tags',
-            'ingredients',
             'author',
             'name',
             'image',
@@ -242,13 +348,26 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
             'is_favorited',
             'is_in_shopping_cart',
         )
+        read_only_fields = fields
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+
     class Meta:
         fields = ('id', 'name', 'image', 'cooking_time')
         model = Recipe
 
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'image': image_url(instance.image, request),
+            'image_variants': image_variant_urls(
+                instance.image_variants, request),
+            'cooking_time': instance.cooking_time,
+        }
+
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     subscribe = CustomUserSerializer()
@@ -256,7 +375,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         many=True,
         read_only=True,
         source='subscribe.recipe_author')
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='subscribe.recipes_count')
 
     class Meta:
         fields = ('subscribe', 'recipes', 'recipes_count')
@@ -275,9 +394,6 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                 'Нельзя подписаться на самого себя!')
         return data
 
-    def get_recipes_count(self, obj):
-        return obj.subscribe.recipe_author.count()
-
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         return {
@@ -0,0 +1,130 @@
+import csv
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import BaseContentNegotiation
+
+from recipes.models import ShoppingListItem
+
+CHUNK_SIZE = 500
+PDF_FONT = 'ShoppingListFont'
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 11
+PDF_TITLE_SIZE = 16
+PDF_LINE_HEIGHT = 16
+
+_font_lock = Lock()
+
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+}
+LARGER_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+
+class IgnoreFormatNegotiation(BaseContentNegotiation):
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_rows(user):
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values('ingredient__name',
+                'ingredient__measurement_unit',
+                'amount', )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def to_base_unit(amount, unit):
+    base_unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+    return amount * factor, base_unit
+
+
+def to_display_unit(amount, unit):
+    if unit in LARGER_UNITS:
+        larger_unit, factor = LARGER_UNITS[unit]
+        if amount >= factor:
+            return amount / factor, larger_unit
+    return amount, unit
+
+
+def format_amount(amount):
+    return f'{amount:.3f}'.rstrip('0').rstrip('.')
+
+
+def normalize_units(rows):
+    for row in rows:
+        amount, unit = to_display_unit(*to_base_unit(
+            row['amount'], row['ingredient__measurement_unit']))
+        yield row['ingredient__name'], format_amount(amount), unit
+
+
+def write_txt(items):
+    for name, amount, unit in items:
+        yield f'{name}\t{amount}\t{unit}\n'
+
+
+def write_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in items:
+        yield writer.writerow(item)
+
+
+def get_pdf_font():
+    with _font_lock:
+        if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(PDF_FONT, settings.PDF_FONT_PATH))
+    return PDF_FONT
+
+
+# The only format that is not streamed: the cross-reference table at the end
+# of the file needs the offsets of every page, so the document is built in
+# memory and sent as one chunk.
+def write_pdf(items):
+    font = get_pdf_font()
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    top = A4[1] - PDF_MARGIN
+    pdf.setFont(font, PDF_TITLE_SIZE)
+    pdf.drawString(PDF_MARGIN, top, 'Список покупок')
+    pdf.setFont(font, PDF_FONT_SIZE)
+    position = top - 2 * PDF_LINE_HEIGHT
+    for name, amount, unit in items:
+        if position < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            position = top
+        pdf.drawString(PDF_MARGIN, position, f'{name} — {amount} {unit}')
+        position -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'txt': (write_txt, 'text/plain; charset=utf-8'),
+    'csv': (write_csv, 'text/csv; charset=utf-8'),
+    'pdf': (write_pdf, 'application/pdf'),
+}
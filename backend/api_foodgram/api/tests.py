@@ -0,0 +1,748 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.asynchronous import AsyncReadRouter, StreamingASGIHandler, async_view
+from api.authentication import SharedTokenCache, token_cache
+from api.metrics import REQUESTS, render_metrics
+from api.middleware import QueryBudgetExceededError, ReplicaRoutingMiddleware
+from api.serializers import CreateRecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import (POPULAR_ORDERING, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, TimelineEntry)
+from users.models import Subscription
+
+from api_foodgram.db import check_connections, mark_connections_idle
+
+User = get_user_model()
+
+RECIPES = 8
+PAGE_SIZES = (2, 6)
+
+
+# Keep catalogue versions remembered so the detail endpoint does not
+# re-read them in the middle of a measured request.
+@override_settings(CATALOGUE_VERSION_TTL=60)
+class RecipeQueryCountTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Reader', last_name='Reader')
+        authors = [
+            User.objects.create(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                first_name='Author', last_name=str(index))
+            for index in range(2)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'tag{index}', color=f'#00000{index}',
+                slug=f'tag{index}')
+            for index in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{index}', measurement_unit='г')
+            for index in range(3)
+        ]
+        for index in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=authors[index % 2], name=f'recipe{index}',
+                text='text', image='recipes/test.jpg', cooking_time=10)
+            recipe.tags.set(tags[:index % 2 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=index + 1)
+                for ingredient in ingredients[:index % 3 + 1])
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, subscribe=authors[0])
+        TimelineEntry.objects.follow(cls.user.pk, authors[0].pk)
+        cls.recipe = Recipe.objects.order_by('pk').first()
+        cls.ingredient = ingredients[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            for limit in PAGE_SIZES:
+                with self.subTest(user=user, limit=limit):
+                    # Tag filter choices, count, page, authors, tags and
+                    # ingredients.
+                    with self.assertNumQueries(6):
+                        response = self.client.get(
+                            f'/api/recipes/?limit={limit}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        self.client.force_authenticate(self.user)
+        for limit in PAGE_SIZES:
+            with self.subTest(limit=limit):
+                # Popular authors, timeline page, recipes with flags,
+                # authors, tags and ingredients.
+                with self.assertNumQueries(6):
+                    response = self.client.get(
+                        f'/api/recipes/feed/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.data['results']), min(limit, RECIPES // 2))
+
+    def test_cook_query_count_does_not_depend_on_page_size(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            for limit in PAGE_SIZES:
+                with self.subTest(user=user, limit=limit):
+                    # Ranking, recipes with flags, authors, tags and
+                    # ingredients.
+                    with self.assertNumQueries(5):
+                        response = self.client.get(
+                            '/api/recipes/cook/?ingredients='
+                            f'{self.ingredient.pk}&limit={limit}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data), limit)
+
+    def test_list_flags(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/recipes/?limit={RECIPES}')
+        flags = {
+            item['id']: (item['is_favorited'], item['is_in_shopping_cart'],
+                         item['author']['is_subscribed'])
+            for item in response.data['results']
+        }
+        for recipe in Recipe.objects.all():
+            self.assertEqual(flags[recipe.pk], (
+                recipe.favorites.filter(user=self.user).exists(),
+                recipe.shopping_cart_recipe.filter(user=self.user).exists(),
+                recipe.author.subscribe.filter(user=self.user).exists(),
+            ))
+
+    def test_detail_query_count(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            with self.subTest(user=user):
+                cache.clear()
+                # Tag filter choices, recipe with flags, author, tags and
+                # ingredients.
+                with self.assertNumQueries(5):
+                    response = self.client.get(
+                        f'/api/recipes/{self.recipe.pk}/')
+                self.assertEqual(response.status_code, 200)
+                # The shared part comes from the cache, flags are one query.
+                with self.assertNumQueries(1 if user else 0):
+                    self.client.get(f'/api/recipes/{self.recipe.pk}/')
+
+
+class ShoppingCartExportTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='buyer', email='buyer@example.com',
+            first_name='Buyer', last_name='Buyer')
+        flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г')
+        milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл')
+        for amounts in ((800, 300), (700, 200)):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'блины {amounts[0]}', text='text',
+                image='recipes/test.jpg', cooking_time=10)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=flour, amount=amounts[0])
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=milk, amount=amounts[1])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        for recipe in Recipe.objects.all():
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    def download(self, export_format):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/?format={export_format}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_txt_normalizes_units(self):
+        self.assertEqual(
+            self.download('txt').decode(),
+            'молоко\t500\tмл\nмука\t1.5\tкг\n')
+
+    def test_txt_format(self):
+        # Pins the format documented in the README: no trailing space, units
+        # without a larger one are kept as is, no trailing zeros.
+        recipe = Recipe.objects.create(
+            author=self.user, name='яичница', text='text',
+            image='recipes/test.jpg', cooking_time=5)
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=2.5,
+            ingredient=Ingredient.objects.create(
+                name='яйца', measurement_unit='шт'))
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(True),
+            ['молоко\t500\tмл\n', 'мука\t1.5\tкг\n', 'яйца\t2.5\tшт\n'])
+
+    def test_pdf(self):
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        # Cyrillic text needs the embedded TrueType font.
+        self.assertIn(b'/FontFile2', content)
+
+
+class ShoppingCartConsistencyTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com',
+            first_name='Cook', last_name='Cook')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='суп', text='text',
+            image='recipes/test.jpg', cooking_time=10)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_delete_does_not_apply_side_effects(self):
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.client.post(url)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_add_recipe_upserts_existing_rows(self):
+        amounts = {self.ingredient.pk: 5}
+        ShoppingListItem.objects.add_recipe([self.user.pk], amounts)
+        ShoppingListItem.objects.add_recipe([self.user.pk], amounts)
+        item = ShoppingListItem.objects.get()
+        self.assertEqual((item.amount, item.recipes_count), (10, 2))
+        ShoppingListItem.objects.remove_recipe([self.user.pk], amounts)
+        ShoppingListItem.objects.remove_recipe([self.user.pk], amounts)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_add_survives_a_concurrent_removal(self):
+        amounts = {self.ingredient.pk: 5}
+        ShoppingListItem.objects.add_recipe([self.user.pk], amounts)
+        items = ShoppingListItem.objects.filter(user=self.user)
+        # A removal has decremented the row but not deleted it yet.
+        items.update(amount=0, recipes_count=0)
+        ShoppingListItem.objects.add_recipe([self.user.pk], amounts)
+        # The removal's cleanup runs after the addition.
+        items.filter(recipes_count__lte=0).delete()
+        item = ShoppingListItem.objects.get()
+        self.assertEqual((item.amount, item.recipes_count), (5, 1))
+
+
+class RecipeCacheInvalidationTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='editor', email='editor@example.com',
+            first_name='Editor', last_name='Editor')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='каша', text='text',
+            image='recipes/test.jpg', cooking_time=10)
+
+    def test_cache_is_dropped_after_commit(self):
+        cache.clear()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.name = 'омлет'
+            self.recipe.save()
+            # Before the commit other requests still see the old payload.
+            self.assertEqual(self.client.get(url).data['name'], 'каша')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data['name'], 'омлет')
+
+    def test_update_without_recipe_fields_drops_cache(self):
+        tag = Tag.objects.create(
+            name='завтрак', color='#E26C2D', slug='zavtrak')
+        ingredient = Ingredient.objects.create(
+            name='овсянка', measurement_unit='г')
+        self.recipe.tags.set([tag])
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=50)
+        cache.clear()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        # The tags stay the same and the amount changes with a bulk update,
+        # so neither the recipe nor its ingredients send a signal.
+        with self.captureOnCommitCallbacks(execute=True):
+            CreateRecipeSerializer().update(self.recipe, {
+                'tags': [tag],
+                'ingredients': [{'id': ingredient.pk, 'amount': 80}],
+            })
+        self.assertEqual(
+            self.client.get(url).data['ingredients'][0]['amount'], 80)
+
+
+class CounterSaveTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='counted', email='counted@example.com',
+            first_name='Counted', last_name='Counted', password='old-pass-1')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='суп', text='text',
+            image='recipes/test.jpg', cooking_time=10)
+
+    def test_set_password_keeps_user_counters(self):
+        # The authenticated instance was loaded before the counters moved.
+        User.objects.filter(pk=self.user.pk).update(
+            followers_count=42, recipes_count=7)
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-pass-1',
+            'new_password': 'new-pass-2',
+        })
+        self.assertEqual(response.status_code, 204)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('new-pass-2'))
+        self.assertEqual((user.followers_count, user.recipes_count), (42, 7))
+
+    def test_recipe_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).bump_counter('favorites_count', 3)
+        recipe.name = 'борщ'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.name, recipe.favorites_count), ('борщ', 3))
+
+    def test_explicit_update_fields_write_counters(self):
+        self.user.followers_count = 5
+        self.user.save(update_fields=['followers_count'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 5)
+
+
+def two_queries_view(request):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.execute('SELECT 2')
+    return HttpResponse()
+
+
+class AsyncReadViewTest(TestCase):
+    @override_settings(QUERY_BUDGET=1, QUERY_BUDGET_STRICT=True)
+    def test_query_budget_covers_pool_threads(self):
+        request = RequestFactory().get('/api/recipes/')
+        with self.assertRaises(QueryBudgetExceededError):
+            async_to_sync(async_view(two_queries_view))(request)
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    def test_streaming_actions_stay_sync(self):
+        router = AsyncReadRouter()
+        router.register('recipes', RecipeViewSet, basename='recipes')
+        callbacks = {url.name: url.callback for url in router.urls}
+        self.assertFalse(asyncio.iscoroutinefunction(
+            callbacks['recipes-download-shopping-cart']))
+        self.assertTrue(asyncio.iscoroutinefunction(
+            callbacks['recipes-list']))
+
+    def test_asgi_handler_streams_database_rows(self):
+        def rows():
+            # Raises SynchronousOnlyOperation inside the event loop.
+            for name in User.objects.values_list('username', flat=True):
+                yield f'{name}\n'
+
+        User.objects.create(username='streamed', email='s@example.com')
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(StreamingASGIHandler().send_response)(
+            StreamingHttpResponse(rows()), send)
+        self.assertEqual(messages[0]['type'], 'http.response.start')
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages[1:]),
+            b'streamed\n')
+        self.assertNotIn('more_body', messages[-1])
+
+
+class TokenCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='holder', email='holder@example.com',
+            first_name='Holder', last_name='Holder')
+
+    def test_revoked_token_is_dropped_for_every_worker(self):
+        self.assertIsInstance(token_cache, SharedTokenCache)
+        token = Token.objects.create(user=self.user)
+        key = token.key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Another worker reads the same backend.
+        other_worker = SharedTokenCache('default', 60)
+        self.assertIsNotNone(other_worker.get(key))
+        token.delete()
+        self.assertIsNone(other_worker.get(key))
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class DatabaseConnectionTest(TestCase):
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_replica_routing_needs_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=True,
+                       DB_CONN_HEALTH_CHECK_IDLE=10)
+    def test_only_idle_connections_are_checked(self):
+        connection.ensure_connection()
+        with mock.patch.object(
+                connection, 'is_usable', return_value=True) as is_usable:
+            mark_connections_idle()
+            check_connections()
+            is_usable.assert_not_called()
+            connection.idle_since = time.monotonic() - 11
+            check_connections()
+            is_usable.assert_called_once_with()
+
+
+class MetricsAggregationTest(APITestCase):
+    def test_scrape_sums_every_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS_MULTIPROCESS_DIR=directory):
+                self.client.get('/api/tags/')
+                labels = next(
+                    labels for labels in REQUESTS.snapshot()
+                    if labels[0] == 'tag-list')
+                # A snapshot left by another worker process.
+                with open(os.path.join(directory, '1.json'), 'w') as file:
+                    json.dump({REQUESTS.name: [[list(labels), 5]]}, file)
+                total = REQUESTS.snapshot()[labels] + 5
+                self.assertIn(
+                    'foodgram_http_requests_total{{view="tag-list",'
+                    'method="GET",status="200"}} {}'.format(total),
+                    render_metrics())
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTimelineTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.other, cls.author, cls.popular = (
+            User.objects.create(
+                username=name, email=f'{name}@example.com',
+                first_name=name, last_name=name)
+            for name in ('reader', 'other', 'author', 'popular')
+        )
+        # Recipes of both authors alternate in time.
+        start = timezone.now() - timedelta(hours=1)
+        cls.recipes = []
+        for index in range(6):
+            recipe = Recipe.objects.create(
+                author=(cls.author, cls.popular)[index % 2],
+                name=f'recipe{index}', text='text',
+                image='recipes/test.jpg', cooking_time=10)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=start + timedelta(minutes=index))
+            cls.recipes.append(recipe.pk)
+        cls.recipes.reverse()
+        # More followers than FEED_FANOUT_MAX_FOLLOWERS.
+        User.objects.filter(pk=cls.popular.pk).update(followers_count=5)
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, author, user=None):
+        self.client.force_authenticate(user or self.reader)
+        response = self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.reader)
+
+    def unsubscribe(self, author, user=None):
+        self.client.force_authenticate(user or self.reader)
+        response = self.client.delete(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.client.force_authenticate(self.reader)
+
+    def feed(self, url='/api/recipes/feed/?limit=10'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def feed_ids(self):
+        return [item['id'] for item in self.feed()['results']]
+
+    def timeline(self, user=None):
+        return set(TimelineEntry.objects.filter(
+            user=user or self.reader).values_list('recipe', flat=True))
+
+    def recipes_of(self, author):
+        return list(Recipe.objects.filter(author=author).order_by(
+            '-pub_date').values_list('pk', flat=True))
+
+    def test_follow_backfills_and_unfollow_cleans_up(self):
+        self.subscribe(self.author)
+        self.assertEqual(self.timeline(), set(self.recipes_of(self.author)))
+        self.assertEqual(self.feed_ids(), self.recipes_of(self.author))
+        self.unsubscribe(self.author)
+        self.assertEqual(self.timeline(), set())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_popular_authors_are_merged_into_the_timeline(self):
+        self.subscribe(self.author)
+        self.subscribe(self.popular)
+        # Only the author below the threshold is written to the timeline.
+        self.assertEqual(self.timeline(), set(self.recipes_of(self.author)))
+        self.assertEqual(self.feed_ids(), self.recipes)
+
+    def test_author_crossing_the_threshold(self):
+        self.subscribe(self.author)
+        self.assertEqual(self.timeline(), set(self.recipes_of(self.author)))
+        # A second follower takes the author over the threshold: the
+        # entries are dropped and the recipes are read at request time.
+        self.subscribe(self.author, user=self.other)
+        self.assertEqual(self.timeline(), set())
+        self.assertEqual(self.timeline(self.other), set())
+        self.assertEqual(self.feed_ids(), self.recipes_of(self.author))
+        # Back at the threshold the entries are written for every follower.
+        self.unsubscribe(self.author, user=self.other)
+        self.assertEqual(self.timeline(), set(self.recipes_of(self.author)))
+        self.assertEqual(self.timeline(self.other), set())
+        self.assertEqual(self.feed_ids(), self.recipes_of(self.author))
+
+    def test_paging_across_sources(self):
+        self.subscribe(self.author)
+        self.subscribe(self.popular)
+        pages = []
+        url = '/api/recipes/feed/?limit=4'
+        while url:
+            data = self.feed(url)
+            pages.append(data)
+            url = data['next']
+        self.assertEqual(
+            [[item['id'] for item in page['results']] for page in pages],
+            [self.recipes[:4], self.recipes[4:]])
+        self.assertIsNone(pages[0]['previous'])
+        previous = self.feed(pages[-1]['previous'])
+        self.assertEqual(
+            [item['id'] for item in previous['results']], self.recipes[:4])
+
+
+class KeysetPaginationTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='paged', email='paged@example.com',
+            first_name='Paged', last_name='Paged')
+        # Two groups of recipes published at the same moment, so the id
+        # decides the order inside a group.
+        moments = [timezone.now() - timedelta(hours=hours) for hours in (1, 2)]
+        for index in range(7):
+            recipe = Recipe.objects.create(
+                author=author, name=f'recipe{index}', text='text',
+                image='recipes/test.jpg', cooking_time=10)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=moments[index % 2], favorites_count=index % 3)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            last = response.data
+            url = response.data[link]
+        return pages, last
+
+    def check_ordering(self, query, ordering):
+        expected = list(Recipe.objects.order_by(*ordering).values_list(
+            'pk', flat=True))
+        pages, last = self.walk(
+            f'/api/recipes/?limit=3&cursor={query}', 'next')
+        self.assertEqual(pages, [expected[:3], expected[3:6], expected[6:]])
+        pages, first = self.walk(last['previous'], 'previous')
+        self.assertEqual(pages, [expected[3:6], expected[:3]])
+        self.assertIsNone(first['previous'])
+
+    def test_pages_forward_and_back_through_tied_dates(self):
+        self.check_ordering('', ('-pub_date', '-id'))
+
+    def test_popular_ordering(self):
+        self.check_ordering('&ordering=popular', POPULAR_ORDERING)
+
+    def test_invalid_cursor(self):
+        def encode(cursor):
+            return urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+        cursors = {
+            'not base64': '@@@',
+            'not json': urlsafe_b64encode(b'cursor').decode(),
+            'no position': encode({'r': False}),
+            'short position': encode({'p': ['7'], 'r': False}),
+            'bad date': encode({'p': ['yesterday', '7'], 'r': False}),
+            'bad id': encode({'p': ['2024-01-01T00:00:00', 'x'], 'r': False}),
+            'not a list': encode({'p': 7, 'r': False}),
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(name):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Неверный курсор.')
+
+
+class SubscriptionListTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='follower', email='follower@example.com',
+            first_name='Follower', last_name='Follower')
+        cls.authors = []
+        start = timezone.now() - timedelta(hours=1)
+        for index in range(3):
+            author = User.objects.create(
+                username=f'writer{index}', email=f'writer{index}@example.com',
+                first_name='Writer', last_name=str(index))
+            for number in range(3):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'recipe{index}-{number}',
+                    text='text', image='recipes/test.jpg', cooking_time=10)
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    pub_date=start + timedelta(minutes=number))
+            # The counter is kept by the recipe endpoints, not by create().
+            User.objects.filter(pk=author.pk).bump_counter('recipes_count', 3)
+            cls.authors.append(author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, authors):
+        for author in authors:
+            Subscription.objects.create(user=self.user, subscribe=author)
+
+    def test_recipes_limit(self):
+        self.subscribe(self.authors)
+        response = self.client.get('/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        for item in response.data['results']:
+            with self.subTest(author=item['username']):
+                self.assertEqual(
+                    [recipe['id'] for recipe in item['recipes']],
+                    list(Recipe.objects.filter(author=item['id']).order_by(
+                        '-pub_date').values_list('pk', flat=True)[:2]))
+                self.assertEqual(item['recipes_count'], 3)
+                self.assertTrue(item['is_subscribed'])
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=-1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_depend_on_authors(self):
+        for count in (1, 3):
+            Subscription.objects.filter(user=self.user).delete()
+            self.subscribe(self.authors[:count])
+            with self.subTest(authors=count):
+                # Count, subscriptions, authors and their recipes.
+                with self.assertNumQueries(4):
+                    response = self.client.get(
+                        '/api/users/subscriptions/?recipes_limit=2')
+                self.assertEqual(len(response.data['results']), count)
+
+
+class CookTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='chef', email='chef@example.com',
+            first_name='Chef', last_name='Chef')
+        cls.eggs, cls.milk, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('яйца', 'молоко', 'мука')
+        )
+        cls.recipes = {}
+        for name, ingredients in (
+            ('омлет', (cls.eggs, cls.milk)),
+            ('блины', (cls.eggs, cls.milk, cls.flour)),
+            ('яичница', (cls.eggs,)),
+            ('лепёшки', (cls.flour,)),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, text='text',
+                image='recipes/test.jpg', cooking_time=10)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients)
+            cls.recipes[name] = recipe
+
+    def cook(self, query):
+        return self.client.get(f'/api/recipes/cook/?{query}')
+
+    def test_ranks_by_coverage(self):
+        response = self.cook(f'ingredients={self.eggs.pk},{self.milk.pk}')
+        self.assertEqual(response.status_code, 200)
+        # Full coverage first, more matched ingredients break ties.
+        self.assertEqual(
+            [(item['name'], item['coverage']) for item in response.data],
+            [('омлет', 1.0), ('яичница', 1.0), ('блины', 0.667)])
+
+    def test_repeated_parameter_and_limit(self):
+        response = self.cook(
+            f'ingredients={self.eggs.pk}&ingredients={self.milk.pk}&limit=1')
+        self.assertEqual(
+            [item['name'] for item in response.data], ['омлет'])
+
+    def test_item_is_a_recipe_with_coverage(self):
+        self.client.force_authenticate(self.user)
+        recipe = self.recipes['яичница']
+        response = self.cook(f'ingredients={self.eggs.pk}&limit=1')
+        item = dict(response.data[0])
+        self.assertEqual(item.pop('coverage'), 1.0)
+        self.assertEqual(
+            item, self.client.get(f'/api/recipes/{recipe.pk}/').data)
+
+    def test_unknown_ingredients_give_an_empty_list(self):
+        response = self.cook('ingredients=999999')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_invalid_ingredients(self):
+        for query, message in (
+            ('', 'Укажите хотя бы один ингредиент.'),
+            ('ingredients=', 'Укажите id ингредиентов через запятую.'),
+            ('ingredients=1,x', 'Укажите id ингредиентов через запятую.'),
+            ('ingredients=-1', 'Укажите id ингредиентов через запятую.'),
+        ):
+            with self.subTest(query=query):
+                response = self.cook(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['ingredients'], message)
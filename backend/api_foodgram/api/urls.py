@@ -1,10 +1,11 @@
 from django.urls import include, path
-from rest_framework.routers import DefaultRouter
 
+from api.asynchronous import AsyncReadRouter
+from api.metrics import metrics_view
 from api.views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
                        TagViewSet)
 
-router = DefaultRouter()
+router = AsyncReadRouter()
 
 router.register('tags', TagViewSet, basename='tag')
 router.register('ingredients', IngredientViewSet, basename='ingredient')
@@ -13,6 +14,7 @@ router.register('users', CustomUserViewSet, basename='users')
 
 
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
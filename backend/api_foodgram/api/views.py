@@ -1,39 +1,52 @@
-import io
-
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from api.asynchronous import sync_only
+from api.caching import CatalogueCacheMixin, RecipeCacheMixin
 from api.filters import RecipeFilter, IngredientFilter
+from api.pagination import (FeedKeysetPagination, KeysetPaginationMixin,
+                            LimitPageNumberPagination, RecipeKeysetPagination,
+                            get_limit)
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (CreateRecipeSerializer, CustomUserSerializer,
                              IngredientSerializer, ReadRecipeSerializer,
                              ShortRecipeSerializer,
                              SubscriptionSerializer,
                              TagSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from api.shopping_cart import (EXPORT_FORMATS, IgnoreFormatNegotiation,
+                               get_shopping_cart_rows, normalize_units)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, TimelineEntry,
+                            attach_read_rows)
+from recipes.search import rank_by_ingredient_coverage
 from users.models import Subscription
 
 User = get_user_model()
 
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CatalogueCacheMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogueCacheMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -41,21 +54,53 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(KeysetPaginationMixin, RecipeCacheMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = CreateRecipeSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly,)
+    keyset_pagination_class = RecipeKeysetPagination
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read(self.request.user)
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return CreateRecipeSerializer
         return ReadRecipeSerializer
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.request.method in SAFE_METHODS:
+            attach_read_rows(page)
+        return page
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            ShoppingListItem.objects.remove_recipe(
+                list(instance.shopping_cart_recipe.values_list(
+                    'user_id', flat=True)),
+                instance.get_ingredient_amounts(),
+            )
+            instance.delete()
+            User.objects.filter(pk=instance.author_id).bump_counter(
+                'recipes_count', -1)
+
     def add_to(self, model, user, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
-        obj, created = model.objects.get_or_create(user=user, recipe=recipe)
+        with transaction.atomic():
+            obj, created = model.objects.get_or_create(
+                user=user, recipe=recipe)
+            if created:
+                Recipe.objects.filter(pk=recipe.pk).bump_counter(
+                    RECIPE_COUNTERS[model], 1)
+            if created and model is ShoppingCart:
+                ShoppingListItem.objects.add_recipe(
+                    [user.id], recipe.get_ingredient_amounts())
         if created:
             serializer = ShortRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -64,8 +109,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def delete_from(self, model, user, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
-        obj = get_object_or_404(model, user=user, recipe=recipe)
-        obj.delete()
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe=recipe).delete()
+            if not deleted:
+                raise Http404
+            Recipe.objects.filter(pk=recipe.pk).bump_counter(
+                RECIPE_COUNTERS[model], -1)
+            if model is ShoppingCart:
+                ShoppingListItem.objects.remove_recipe(
+                    [user.id], recipe.get_ingredient_amounts())
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -92,48 +145,108 @@ class RecipeViewSet(viewsets.ModelViewSet):
         elif request.method == 'DELETE':
             return self.delete_from(ShoppingCart, request.user, pk)
 
+    @sync_only
     @action(
         detail=False,
         methods=('GET',),
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatNegotiation,
     )
     def download_shopping_cart(self, request):
-        shopping_cart = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_cart_recipe__user=request.user
-            )
-            .values('ingredient__name',
-                    'ingredient__measurement_unit', )
-            .annotate(amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-
-        buffer = io.StringIO()
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'format': (
+                f'Доступные форматы: {", ".join(EXPORT_FORMATS)}.')})
+        writer, content_type = EXPORT_FORMATS[export_format]
+        # txt and csv are written row by row, pdf is built in memory first.
+        items = normalize_units(get_shopping_cart_rows(request.user))
+        response = StreamingHttpResponse(
+            writer(items), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{export_format}"')
+        return response
 
-        for item in shopping_cart:
-            buffer.write(f"{item['ingredient__name']}\t")
-            buffer.write(f"{item['amount']}\t")
-            buffer.write(f"{item['ingredient__measurement_unit']} \n")
+    @action(
+        detail=False,
+        methods=('GET',),
+        url_path='feed',
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        paginator = FeedKeysetPagination()
+        page = attach_read_rows(paginator.paginate_queryset(
+            self.get_queryset(), request, view=self))
+        serializer = ReadRecipeSerializer(
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
-        response = FileResponse(buffer.getvalue(), content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_cart.txt"'
-        return response
+    @action(
+        detail=False,
+        methods=('GET',),
+        url_path='cook',
+    )
+    def cook(self, request):
+        ingredient_ids = set()
+        for value in request.query_params.getlist('ingredients'):
+            for ingredient_id in value.split(','):
+                if not ingredient_id.strip().isdigit():
+                    raise ValidationError({'ingredients': (
+                        'Укажите id ингредиентов через запятую.')})
+                ingredient_ids.add(int(ingredient_id))
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': (
+                'Укажите хотя бы один ингредиент.')})
+        ranking = list(rank_by_ingredient_coverage(
+            ingredient_ids, get_limit(request)))
+        recipes = Recipe.objects.for_read(request.user).in_bulk(
+            [row['recipe'] for row in ranking])
+        ranking = [row for row in ranking if row['recipe'] in recipes]
+        serializer = ReadRecipeSerializer(
+            attach_read_rows([recipes[row['recipe']] for row in ranking]),
+            many=True,
+            context={'request': request},
+        )
+        data = []
+        for item, row in zip(serializer.data, ranking):
+            item['coverage'] = round(row['coverage'], 3)
+            data.append(item)
+        return Response(data)
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(KeysetPaginationMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = LimitPageNumberPagination
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    def get_queryset(self):
+        return super().get_queryset().with_is_subscribed(self.request.user)
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        if not recipes_limit.isdigit():
+            raise ValidationError(
+                {'recipes_limit': 'Должно быть неотрицательным целым числом.'})
+        return int(recipes_limit)
+
+    def get_subscriptions(self, queryset):
+        authors = User.objects.with_is_subscribed(self.request.user)
+        recipes = Recipe.objects.latest_per_author(self.get_recipes_limit())
+        return queryset.prefetch_related(
+            Prefetch('subscribe', queryset=authors),
+            Prefetch('subscribe__recipe_author', queryset=recipes),
+        )
+
     @action(methods=('GET', ),
             url_path='subscriptions', detail=False,
             permission_classes=(IsAuthenticated,))
     def read_subscribe(self, request):
         user = request.user
-        subscriptions = Subscription.objects.filter(user=user)
+        subscriptions = self.get_subscriptions(
+            Subscription.objects.filter(user=user).order_by('-id'))
         page = self.paginate_queryset(subscriptions)
         serializer = SubscriptionSerializer(page, many=True,
                                             context={'request': request})
@@ -146,17 +259,26 @@ class CustomUserViewSet(UserViewSet):
         user = request.user
         subscribe = get_object_or_404(User, id=id)
         if request.method == 'POST':
-            subscription = Subscription.objects.create(
-                user=user, subscribe=subscribe)
+            subscriptions = self.get_subscriptions(
+                Subscription.objects.filter(user=user, subscribe=subscribe))
+            with transaction.atomic():
+                Subscription.objects.create(user=user, subscribe=subscribe)
+                User.objects.filter(pk=subscribe.pk).bump_counter(
+                    'followers_count', 1)
+                TimelineEntry.objects.follow(user.pk, subscribe.pk)
             serializer = SubscriptionSerializer(
-                subscription,
+                subscriptions.get(),
                 context={'request': request},
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE':
             subscribe = self.get_object()
-            deleted = Subscription.objects.get(
-                user=user, subscribe=subscribe).delete()
+            with transaction.atomic():
+                deleted = Subscription.objects.get(
+                    user=user, subscribe=subscribe).delete()
+                User.objects.filter(pk=subscribe.pk).bump_counter(
+                    'followers_count', -1)
+                TimelineEntry.objects.unfollow(user.pk, subscribe.pk)
             if deleted:
                 return Response({
                     'message': 'Вы отписались от этого автора'},
@@ -0,0 +1,54 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def use_primary():
+    token = read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        read_from_replica.reset(token)
+
+
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+def check_connections(**kwargs):
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    # A connection that served a request moments ago is alive, so only the
+    # ones that sat idle long enough to be dropped by the server are pinged.
+    stale = time.monotonic() - settings.DB_CONN_HEALTH_CHECK_IDLE
+    for connection in connections.all():
+        if (connection.connection is not None
+                and getattr(connection, 'idle_since', 0) <= stale
+                and not connection.is_usable()):
+            connection.close()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and read_from_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
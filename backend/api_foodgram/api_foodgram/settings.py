@@ -44,6 +44,7 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +52,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'api_foodgram.urls'
@@ -80,10 +83,44 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default=None),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=None),
         'HOST': os.getenv('DB_HOST', default=None),
-        'PORT': os.getenv('DB_PORT', default=None)
+        'PORT': os.getenv('DB_PORT', default=None),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+DB_CONN_HEALTH_CHECKS = bool(strtobool(os.getenv('DB_CONN_HEALTH_CHECKS', 'True')))
+DB_CONN_HEALTH_CHECK_IDLE = float(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', default=10))
+
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['api_foodgram.db.ReplicaRouter']
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', default=10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+CATALOGUE_VERSION_TTL = float(os.getenv('CATALOGUE_VERSION_TTL', default=1))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=60 * 60))
+
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', default='default')
+TOKEN_CACHE_LOCAL = bool(strtobool(os.getenv('TOKEN_CACHE_LOCAL', 'False')))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=4096))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -121,14 +158,34 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
-    'PAGINATE_BY_PARAM': 'limit',
 }
 
+ASYNC_READ_VIEWS = bool(strtobool(os.getenv('ASYNC_READ_VIEWS', 'False')))
+
+PDF_FONT_PATH = os.getenv('PDF_FONT_PATH', default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=1000))
+
+METRICS_ENABLED = bool(strtobool(os.getenv('METRICS_ENABLED', 'True')))
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', default='127.0.0.1').split(',')
+METRICS_MULTIPROCESS_DIR = os.getenv('METRICS_MULTIPROCESS_DIR', default='')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', default=1))
+
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', default=0))
+QUERY_BUDGET_STRICT = bool(strtobool(os.getenv('QUERY_BUDGET_STRICT', 'False')))
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
@@ -142,3 +199,4 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
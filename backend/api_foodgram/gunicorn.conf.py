@@ -0,0 +1,20 @@
+import glob
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv(
+    'GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+# Workers inherit the variable and aggregate /api/metrics through it.
+metrics_dir = os.environ.setdefault(
+    'METRICS_MULTIPROCESS_DIR', '/tmp/foodgram-metrics')
+
+
+def on_starting(server):
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.json*')):
+        os.remove(path)
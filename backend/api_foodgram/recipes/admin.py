@@ -3,7 +3,8 @@ from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag,
+                            TimelineEntry)
 
 
 class IngredientResource(resources.ModelResource):
@@ -31,12 +32,11 @@ class AdminTag(admin.ModelAdmin):
 @admin.register(Recipe)
 class AdminRecipe(admin.ModelAdmin):
     list_display = (
-        'author', 'name', 'image', 'cooking_time', 'text', 'count_favorites',
+        'author', 'name', 'image', 'cooking_time', 'text', 'favorites_count',
+        'in_carts_count',
     )
     list_filter = ('name', 'author', 'tags',)
-
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 @admin.register(RecipeIngredient)
@@ -52,3 +52,14 @@ class AdminFavorite(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class AdminShoppingCart(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'user')
+
+
+@admin.register(ShoppingListItem)
+class AdminShoppingListItem(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount', 'recipes_count')
+
+
+@admin.register(TimelineEntry)
+class AdminTimelineEntry(admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe', 'pub_date')
+    raw_id_fields = ('user', 'recipe')
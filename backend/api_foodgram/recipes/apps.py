@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from import_export.signals import post_import
+
+        from recipes.catalogue import bump_imported_version, bump_version
+        from recipes.models import Ingredient, Recipe, Tag
+        from recipes.search import index_recipe, unindex_recipe
+
+        for model in (Ingredient, Tag):
+            post_save.connect(bump_version, sender=model)
+            post_delete.connect(bump_version, sender=model)
+        post_import.connect(bump_imported_version)
+        post_save.connect(index_recipe, sender=Recipe)
+        post_delete.connect(unindex_recipe, sender=Recipe)
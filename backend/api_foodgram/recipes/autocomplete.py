@@ -0,0 +1,82 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower
+
+from recipes.catalogue import get_version
+from recipes.models import Ingredient
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.version = None
+        self.index = ([], [])
+        self.lock = Lock()
+
+    def refresh(self):
+        version = get_version(Ingredient)
+        if version == self.version:
+            return
+        with self.lock:
+            rows = sorted(
+                (name.lower(), pk)
+                for pk, name in Ingredient.objects.values_list('pk', 'name')
+            )
+            self.index = (
+                [key for key, _ in rows],
+                [pk for _, pk in rows],
+            )
+            self.version = version
+
+    def search(self, query, limit):
+        self.refresh()
+        keys, ids = self.index
+        query = query.lower()
+        found = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(ids[position])
+            position += 1
+        if len(found) < limit:
+            for key, pk in zip(keys, ids):
+                if query in key and not key.startswith(query):
+                    found.append(pk)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+def rank_by_name(queryset, query):
+    query = query.lower()
+    return queryset.annotate(
+        lower_name=Lower('name'),
+    ).filter(
+        lower_name__contains=query,
+    ).annotate(
+        rank=Case(
+            When(lower_name__startswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+    ).order_by('rank', 'lower_name')
+
+
+def autocomplete(queryset, query, limit=AUTOCOMPLETE_LIMIT):
+    if connections[queryset.db].vendor == 'postgresql':
+        return rank_by_name(queryset, query)[:limit]
+    ids = ingredient_index.search(query, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *[When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    ))
@@ -0,0 +1,45 @@
+import time
+from threading import Lock
+
+from django.conf import settings
+
+_versions = {}
+_versions_lock = Lock()
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _remember(label, version):
+    with _versions_lock:
+        _versions[label] = (
+            time.monotonic() + settings.CATALOGUE_VERSION_TTL, version)
+    return version
+
+
+def get_version(model):
+    from recipes.models import CatalogueVersion
+
+    label = _label(model)
+    with _versions_lock:
+        entry = _versions.get(label)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    version, _ = CatalogueVersion.objects.using('default').get_or_create(
+        label=label, defaults={'version': time.time_ns()})
+    return _remember(label, version.version)
+
+
+def bump_version(sender, **kwargs):
+    from recipes.models import CatalogueVersion
+
+    label = _label(sender)
+    version = time.time_ns()
+    CatalogueVersion.objects.update_or_create(
+        label=label, defaults={'version': version})
+    _remember(label, version)
+
+
+def bump_imported_version(sender, model, **kwargs):
+    bump_version(model)
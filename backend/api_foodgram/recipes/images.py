@@ -0,0 +1,84 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 80
+VARIANTS_DIR = 'recipes/variants/'
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+    return _executor
+
+
+def render_variants(name):
+    with default_storage.open(name) as image_file:
+        image = Image.open(image_file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    rendered_widths = set()
+    for width in VARIANT_WIDTHS:
+        target_width = min(width, image.width)
+        if target_width in rendered_widths:
+            continue
+        rendered_widths.add(target_width)
+        variant = image.copy()
+        variant.thumbnail((target_width, image.height))
+        buffer = BytesIO()
+        variant.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+        variants[str(width)] = default_storage.save(
+            f'{VARIANTS_DIR}{stem}-{width}.webp',
+            ContentFile(buffer.getvalue()),
+        )
+    return variants
+
+
+def build_image_variants(recipe_id):
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None or not recipe.image:
+            return
+        name = recipe.image.name
+        variants = render_variants(name)
+        recipe.refresh_from_db(fields=['image'])
+        if recipe.image.name != name:
+            return
+        recipe.image_variants = variants
+        recipe.save(update_fields=['image_variants'])
+    except Exception:
+        logger.exception('Failed to build image variants for recipe %s',
+                         recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(recipe_id):
+    transaction.on_commit(
+        lambda: get_executor().submit(build_image_variants, recipe_id))
@@ -0,0 +1,68 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+IMAGES_DIR = 'recipes'
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки рецептов, на которые не ссылается '
+            'ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе указанного числа минут.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.',
+        )
+
+    def handle(self, *args, **options):
+        references = self.count_references()
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        orphans = [
+            name for name in self.walk(IMAGES_DIR)
+            if name not in references
+            and default_storage.get_modified_time(name) < cutoff
+        ]
+        for name in orphans:
+            self.stdout.write(name)
+            if not options['dry_run']:
+                default_storage.delete(name)
+        shared = sum(1 for count in references.values() if count > 1)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов в использовании: {len(references)}, '
+            f'из них общих для нескольких рецептов: {shared}. '
+            f'Удалено неиспользуемых: '
+            f'{0 if options["dry_run"] else len(orphans)}.'))
+
+    def count_references(self):
+        references = dict(
+            Recipe.objects.exclude(image='')
+            .values_list('image')
+            .annotate(count=Count('pk'))
+            .order_by()
+        )
+        for variants in Recipe.objects.exclude(
+                image_variants={}).values_list('image_variants', flat=True):
+            for name in variants.values():
+                references[name] = references.get(name, 0) + 1
+        return references
+
+    def walk(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for subdirectory in directories:
+            yield from self.walk(posixpath.join(directory, subdirectory))
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from itertools import accumulate
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.images import render_variants
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import reindex_recipes
+from users.models import Subscription
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+ZIPF_EXPONENT = 1.1
+INGREDIENTS_PER_RECIPE = (3, 15)
+TAGS_PER_RECIPE = (1, 3)
+COOKING_TIME = (5, 180)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+PUBLISHED_FROM = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PUBLISHED_SPAN = timedelta(days=365)
+IMAGE_SIZE = (1280, 960)
+
+
+def zipf_weights(size):
+    return list(accumulate(
+        1 / rank ** ZIPF_EXPONENT for rank in range(1, size + 1)))
+
+
+def pick(rng, population, weights, count):
+    count = min(count, len(population))
+    chosen = {}
+    while len(chosen) < count:
+        for item in rng.choices(population, cum_weights=weights,
+                                k=count - len(chosen)):
+            chosen.setdefault(item, None)
+    return list(chosen)
+
+
+def count_rows():
+    return [model.objects.count()
+            for model in (User, Recipe, Subscription, Favorite, ShoppingCart)]
+
+
+def placeholder_image(rng):
+    color = tuple(rng.randrange(256) for _ in range(3))
+    buffer = BytesIO()
+    Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+    return default_storage.save(
+        'recipes/dataset.jpg', ContentFile(buffer.getvalue()))
+
+
+class Command(BaseCommand):
+    help = ('Создаёт детерминированный синтетический набор данных для '
+            'нагрузочного тестирования: пользователей, рецепты, подписки, '
+            'избранное и корзины.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Сколько авторов не больше подписывается каждый '
+                 'пользователь.',
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=30,
+            help='Сколько рецептов не больше у каждого в избранном.',
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=5,
+            help='Сколько рецептов не больше у каждого в корзине.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='load',
+            help='Префикс имён пользователей набора.',
+        )
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument(
+            '--manifest',
+            type=Path,
+            default=Path('dataset.json'),
+            help='Куда записать токены и идентификаторы для loadtest.py.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        tags = list(Tag.objects.order_by('pk').values_list('pk', 'slug'))
+        if not ingredients or not tags:
+            raise CommandError(
+                'Нет ингредиентов или тэгов. Сначала загрузите справочник '
+                'командой load_catalogue.')
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом «{prefix}» уже есть. '
+                'Укажите другой --prefix.')
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        user_count, recipe_count = options['users'], options['recipes']
+        user_weights = zipf_weights(user_count)
+        authors = rng.choices(
+            range(user_count), cum_weights=user_weights, k=recipe_count)
+        follows = set()
+        for follower in range(user_count):
+            for author in pick(rng, range(user_count), user_weights,
+                               rng.randint(0, options['follows'])):
+                if author != follower:
+                    follows.add((follower, author))
+        recipe_order = list(range(recipe_count))
+        rng.shuffle(recipe_order)
+        recipe_weights = zipf_weights(recipe_count)
+        favorites, carts = [], []
+        for user in range(user_count):
+            for target, limit in ((favorites, options['favorites']),
+                                  (carts, options['carts'])):
+                target.extend(
+                    (user, recipe) for recipe in pick(
+                        rng, recipe_order, recipe_weights,
+                        rng.randint(0, limit)))
+
+        image = placeholder_image(rng)
+        image_variants = render_variants(image)
+        before = count_rows()
+        with transaction.atomic():
+            users = self.create_users(
+                prefix, user_count, authors, follows, options['password'])
+            recipes = self.create_recipes(
+                rng, users, authors, favorites, carts, ingredients, tags,
+                image, image_variants)
+            Subscription.objects.bulk_create(
+                [Subscription(user=users[follower], subscribe=users[author])
+                 for follower, author in sorted(follows)],
+                batch_size=self.batch_size,
+            )
+            for model, pairs in ((Favorite, favorites),
+                                 (ShoppingCart, carts)):
+                model.objects.bulk_create(
+                    [model(user=users[user], recipe=recipes[recipe])
+                     for user, recipe in pairs],
+                    batch_size=self.batch_size,
+                )
+            tokens = [
+                Token(key=hashlib.sha1(
+                    f'{prefix}:{options["seed"]}:{index}'.encode()
+                ).hexdigest(), user=user)
+                for index, user in enumerate(users)
+            ]
+            Token.objects.bulk_create(tokens, batch_size=self.batch_size)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        reindex_recipes()
+
+        options['manifest'].write_text(json.dumps({
+            'seed': options['seed'],
+            'tokens': [token.key for token in tokens],
+            'users': [user.pk for user in users],
+            'recipes': [recipe.pk for recipe in recipes],
+            'tags': [slug for pk, slug in tags],
+        }))
+        created = [
+            after - count for after, count in zip(count_rows(), before)]
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Создано пользователей: {}, рецептов: {}, подписок: {}, '
+            'избранного: {}, в корзинах: {} за {:.1f} с. '
+            'Манифест: {}.'.format(*created, elapsed, options['manifest'])))
+
+    def insert(self, model, objects):
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if objects and objects[0].pk is None:
+            pks = (model.objects.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True))
+            for instance, pk in zip(objects, pks):
+                instance.pk = pk
+        return objects
+
+    def create_users(self, prefix, count, authors, follows, password):
+        password = make_password(password)
+        recipes_count = [0] * count
+        followers_count = [0] * count
+        for author in authors:
+            recipes_count[author] += 1
+        for follower, author in follows:
+            followers_count[author] += 1
+        return self.insert(User, [
+            User(
+                username=f'{prefix}{index}',
+                email=f'{prefix}{index}@example.com',
+                first_name='Пользователь',
+                last_name=str(index),
+                password=password,
+                recipes_count=recipes_count[index],
+                followers_count=followers_count[index],
+            )
+            for index in range(count)
+        ])
+
+    def create_recipes(self, rng, users, authors, favorites, carts,
+                       ingredients, tags, image, image_variants):
+        favorites_count = [0] * len(authors)
+        in_carts_count = [0] * len(authors)
+        for user, recipe in favorites:
+            favorites_count[recipe] += 1
+        for user, recipe in carts:
+            in_carts_count[recipe] += 1
+        ingredient_weights = zipf_weights(len(ingredients))
+        names = dict(Ingredient.objects.values_list('pk', 'name'))
+        compositions = [
+            pick(rng, ingredients, ingredient_weights,
+                 rng.randint(*INGREDIENTS_PER_RECIPE))
+            for _ in authors
+        ]
+        recipes = self.insert(Recipe, [
+            Recipe(
+                author=users[author],
+                name=' '.join(names[pk] for pk in composition[:2])
+                .capitalize()[:256],
+                text='Смешайте {}. Готовьте {} минут.'.format(
+                    ', '.join(names[pk] for pk in composition),
+                    cooking_time),
+                image=image,
+                image_variants=image_variants,
+                cooking_time=cooking_time,
+                favorites_count=favorites_count[index],
+                in_carts_count=in_carts_count[index],
+            )
+            for index, (author, composition, cooking_time) in enumerate(zip(
+                authors, compositions,
+                (rng.randint(*COOKING_TIME) for _ in authors)))
+        ])
+        offsets = sorted(rng.random() for _ in recipes)
+        for recipe, offset in zip(recipes, offsets):
+            recipe.pub_date = PUBLISHED_FROM + PUBLISHED_SPAN * offset
+        Recipe.objects.bulk_update(
+            recipes, ['pub_date'], batch_size=self.batch_size)
+        RecipeIngredient.objects.bulk_create(
+            [RecipeIngredient(recipe=recipe, ingredient_id=pk,
+                              amount=rng.choice(AMOUNTS))
+             for recipe, composition in zip(recipes, compositions)
+             for pk in composition],
+            batch_size=self.batch_size,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            [Recipe.tags.through(recipe_id=recipe.pk, tag_id=pk)
+             for recipe in recipes
+             for pk, slug in rng.sample(
+                 tags, min(len(tags), rng.randint(*TAGS_PER_RECIPE)))],
+            batch_size=self.batch_size,
+        )
+        return recipes
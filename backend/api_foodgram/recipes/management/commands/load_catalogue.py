@@ -0,0 +1,191 @@
+import codecs
+import csv
+import io
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.catalogue import bump_version
+from recipes.models import Ingredient, Tag
+
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s*')
+ITEM_SEPARATORS = re.compile(r'[\s,]*')
+FALLBACK_ENCODING = 'cp1251'
+
+
+def iter_json_array(file):
+    decoder = json.JSONDecoder()
+    buffer, position, opened = '', 0, False
+    while True:
+        separators = ITEM_SEPARATORS if opened else WHITESPACE
+        position = separators.match(buffer, position).end()
+        if position == len(buffer):
+            buffer, position = file.read(READ_SIZE), 0
+            if not buffer:
+                raise ValueError('JSON-массив не закрыт')
+            continue
+        if not opened:
+            if buffer[position] != '[':
+                raise ValueError('ожидался JSON-массив')
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item
+
+
+def detect_encoding(path):
+    with open(path, 'rb') as file:
+        head = file.read(READ_SIZE)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return 'utf-8-sig'
+
+
+def iter_catalogue(path, encoding):
+    with open(path, encoding=encoding, newline='') as file:
+        if path.suffix == '.csv':
+            for row in csv.reader(file):
+                if row:
+                    yield Ingredient, dict(
+                        zip(('name', 'measurement_unit'), row))
+            return
+        for item in iter_json_array(file):
+            if 'model' not in item:
+                yield Ingredient, item
+            elif item['model'] == 'recipes.ingredient':
+                yield Ingredient, item['fields']
+            elif item['model'] == 'recipes.tag':
+                yield Tag, item['fields']
+
+
+def clean(model, fields):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        value = str(fields.get(field.name) or '').strip()
+        if not value or len(value) > field.max_length:
+            return None
+        values[field.name] = value
+    return values
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты и тэги из CSV, JSON или фикстуры '
+            'пакетами, пропуская уже существующие.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=Path)
+        parser.add_argument(
+            '--encoding',
+            help=('Кодировка файлов. По умолчанию UTF-8, а если файл '
+                  f'в ней не читается, {FALLBACK_ENCODING}.'),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.existing = {
+            Ingredient: set(Ingredient.objects.values_list('name', flat=True)),
+            Tag: set(Tag.objects.values_list('name', flat=True)),
+        }
+        self.read = self.inserted = self.skipped = 0
+        self.loaded = set()
+        started = time.monotonic()
+        for path in options['paths']:
+            try:
+                self.load_file(
+                    path, options['encoding'] or detect_encoding(path))
+            except UnicodeDecodeError as error:
+                raise CommandError(
+                    f'{path}: {error}. Укажите кодировку через --encoding.')
+            except (OSError, ValueError) as error:
+                raise CommandError(f'{path}: {error}')
+        for model in self.loaded:
+            bump_version(model)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано: {self.read}, добавлено: {self.inserted}, '
+            f'пропущено: {self.skipped} за {elapsed:.2f} с '
+            f'({self.read / max(elapsed, 1e-9):.0f} строк/с).'))
+
+    def load_file(self, path, encoding):
+        batches = {Ingredient: [], Tag: []}
+        for model, fields in iter_catalogue(path, encoding):
+            self.read += 1
+            values = clean(model, fields)
+            if values is None:
+                self.skipped += 1
+                self.stderr.write(f'Пропущена строка: {fields}')
+                continue
+            if values['name'] in self.existing[model]:
+                self.skipped += 1
+                continue
+            self.existing[model].add(values['name'])
+            batch = batches[model]
+            batch.append(values)
+            if len(batch) >= self.batch_size:
+                self.insert(model, batch)
+                batch.clear()
+        for model, batch in batches.items():
+            if batch:
+                self.insert(model, batch)
+
+    def insert(self, model, batch):
+        self.loaded.add(model)
+        if model is Ingredient and connection.vendor == 'postgresql':
+            inserted = self.copy_ingredients(batch)
+        else:
+            # Conflicting rows are dropped silently, so the number of added
+            # rows is taken from the table rather than from the batch size.
+            before = model.objects.count()
+            model.objects.bulk_create(
+                [model(**fields) for fields in batch],
+                ignore_conflicts=True,
+            )
+            inserted = model.objects.count() - before
+        self.inserted += inserted
+        self.skipped += len(batch) - inserted
+
+    @transaction.atomic
+    def copy_ingredients(self, batch):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for fields in batch:
+            writer.writerow((fields['name'], fields['measurement_unit']))
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name text, measurement_unit text) ON COMMIT DROP')
+            cursor.copy_expert(
+                'COPY ingredient_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name) DO NOTHING')
+            return cursor.rowcount
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает списки покупок из корзин пользователей '
+            'или сверяет их с корзинами (--check).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить списки покупок, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_lists()
+        else:
+            self.rebuild_lists()
+
+    def rebuild_lists(self):
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            items = ShoppingListItem.objects.bulk_create(
+                [ShoppingListItem(user_id=row['user_id'],
+                                  ingredient_id=row['ingredient_id'],
+                                  amount=row['total'],
+                                  recipes_count=row['recipes'])
+                 for row in ShoppingListItem.objects.cart_totals()],
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны: {len(items)} позиций.'))
+
+    def check_lists(self):
+        expected = {
+            (row['user_id'], row['ingredient_id']):
+                (row['total'], row['recipes'])
+            for row in ShoppingListItem.objects.cart_totals()
+        }
+        mismatches = 0
+        for user_id, ingredient_id, amount, recipes_count in (
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount', 'recipes_count'
+            ).iterator(chunk_size=BATCH_SIZE)
+        ):
+            total, recipes = expected.pop(
+                (user_id, ingredient_id), (0, 0))
+            if abs(total - amount) > TOLERANCE or recipes != recipes_count:
+                mismatches += 1
+                self.stdout.write(
+                    f'{user_id} {ingredient_id}: {amount} '
+                    f'({recipes_count}), ожидалось {total} ({recipes})')
+        for (user_id, ingredient_id), (total, recipes) in expected.items():
+            mismatches += 1
+            self.stdout.write(
+                f'{user_id} {ingredient_id}: нет позиции, '
+                f'ожидалось {total} ({recipes})')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите команду без --check, чтобы пересобрать списки.')
+        self.stdout.write(self.style.SUCCESS('Списки покупок актуальны.'))
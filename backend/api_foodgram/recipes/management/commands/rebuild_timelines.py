@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок из подписок и рецептов '
+            'или сверяет их с подписками (--check).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить ленты, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_timelines()
+        else:
+            self.rebuild_timelines()
+
+    def rebuild_timelines(self):
+        created = 0
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            batch = []
+            for user_id, recipe_id, pub_date in (
+                TimelineEntry.objects.expected_entries()
+                .iterator(chunk_size=BATCH_SIZE)
+            ):
+                batch.append(TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id, pub_date=pub_date))
+                if len(batch) == BATCH_SIZE:
+                    created += len(
+                        TimelineEntry.objects.bulk_create(batch))
+                    batch = []
+            created += len(TimelineEntry.objects.bulk_create(batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны: {created} записей.'))
+
+    def check_timelines(self):
+        expected = {
+            (user_id, recipe_id): pub_date
+            for user_id, recipe_id, pub_date in
+            TimelineEntry.objects.expected_entries()
+            .iterator(chunk_size=BATCH_SIZE)
+        }
+        mismatches = 0
+        for user_id, recipe_id, pub_date in (
+            TimelineEntry.objects.values_list(
+                'user_id', 'recipe_id', 'pub_date'
+            ).iterator(chunk_size=BATCH_SIZE)
+        ):
+            if (user_id, recipe_id) not in expected:
+                mismatches += 1
+                self.stdout.write(f'{user_id} {recipe_id}: лишняя запись')
+            elif expected.pop((user_id, recipe_id)) != pub_date:
+                mismatches += 1
+                self.stdout.write(
+                    f'{user_id} {recipe_id}: неверная дата {pub_date}')
+        for user_id, recipe_id in expected:
+            mismatches += 1
+            self.stdout.write(f'{user_id} {recipe_id}: нет записи')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите команду без --check, чтобы пересобрать ленты.')
+        self.stdout.write(self.style.SUCCESS('Ленты подписок актуальны.'))
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+BATCH_SIZE = 1000
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'followers_count', Subscription, 'subscribe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def actual_count(source, field):
+    return Coalesce(Subquery(
+        source.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, корзин, подписчиков '
+            'и рецептов или сверяет их с данными (--check).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счётчики, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for model, counter, source, field in COUNTERS:
+            drifted = list(
+                model.objects
+                .annotate(actual=actual_count(source, field))
+                .exclude(**{counter: F('actual')})
+                .values_list('pk', counter, 'actual')
+            )
+            for pk, value, actual in drifted:
+                self.stdout.write(
+                    f'{model._meta.model_name} {pk} {counter}: {value}, '
+                    f'ожидалось {actual}')
+            mismatches += len(drifted)
+            if options['check']:
+                continue
+            pks = [pk for pk, value, actual in drifted]
+            for start in range(0, len(pks), BATCH_SIZE):
+                model.objects.filter(
+                    pk__in=pks[start:start + BATCH_SIZE]
+                ).update(**{counter: actual_count(source, field)})
+        if options['check'] and mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите команду без --check, чтобы исправить счётчики.')
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Счётчики актуальны.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счётчиков: {mismatches}.'))
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    totals = (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart_recipe__isnull=False)
+        .values('ingredient_id',
+                user_id=models.F('recipe__shopping_cart_recipe__user'))
+        .annotate(total=models.Sum('amount'),
+                  recipes=models.Count('recipe', distinct=True))
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=row['user_id'],
+                          ingredient_id=row['ingredient_id'],
+                          amount=row['total'],
+                          recipes_count=row['recipes'])
+         for row in totals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField(verbose_name='Количество')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Количество рецептов в корзине')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+
+
+def duplicates(model, fields):
+    return (
+        model.objects.values(*fields)
+        .annotate(keep_id=models.Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+
+
+def merge_recipe_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    for row in duplicates(RecipeIngredient, ('recipe', 'ingredient')):
+        rows = RecipeIngredient.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient'])
+        total = rows.aggregate(total=models.Sum('amount'))['total']
+        rows.filter(id=row['keep_id']).update(amount=total)
+        rows.exclude(id=row['keep_id']).delete()
+
+
+def remove_shopping_cart_duplicates(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    users = set()
+    for row in duplicates(ShoppingCart, ('user', 'recipe')):
+        ShoppingCart.objects.filter(
+            user=row['user'], recipe=row['recipe'],
+        ).exclude(id=row['keep_id']).delete()
+        users.add(row['user'])
+    if not users:
+        return
+    ShoppingListItem.objects.filter(user__in=users).delete()
+    totals = (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart_recipe__user__in=users)
+        .values('ingredient_id',
+                user_id=models.F('recipe__shopping_cart_recipe__user'))
+        .annotate(total=models.Sum('amount'),
+                  recipes=models.Count('recipe', distinct=True))
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=row['user_id'],
+                          ingredient_id=row['ingredient_id'],
+                          amount=row['total'],
+                          recipes_count=row['recipes'])
+         for row in totals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_recipe_ingredients, migrations.RunPython.noop),
+        migrations.RunPython(
+            remove_shopping_cart_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    'CREATE INDEX recipes_ingredient_search_vector ON recipes_ingredient '
+    "USING gin (to_tsvector('russian', name))",
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_ingredient_search_vector',
+)
+# Ingredients are loaded with bulk_create, which sends no signals, so the
+# index is kept in sync by triggers instead of receivers.
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_ingredient_fts '
+    "USING fts5(name, content='recipes_ingredient', content_rowid='id', "
+    "tokenize='unicode61')",
+    'CREATE TRIGGER recipes_ingredient_fts_insert '
+    'AFTER INSERT ON recipes_ingredient BEGIN '
+    'INSERT INTO recipes_ingredient_fts (rowid, name) '
+    'VALUES (new.id, new.name); END',
+    'CREATE TRIGGER recipes_ingredient_fts_delete '
+    'AFTER DELETE ON recipes_ingredient BEGIN '
+    'INSERT INTO recipes_ingredient_fts (recipes_ingredient_fts, rowid, name) '
+    "VALUES ('delete', old.id, old.name); END",
+    'CREATE TRIGGER recipes_ingredient_fts_update '
+    'AFTER UPDATE ON recipes_ingredient BEGIN '
+    'INSERT INTO recipes_ingredient_fts (recipes_ingredient_fts, rowid, name) '
+    "VALUES ('delete', old.id, old.name); "
+    'INSERT INTO recipes_ingredient_fts (rowid, name) '
+    'VALUES (new.id, new.name); END',
+    "INSERT INTO recipes_ingredient_fts (recipes_ingredient_fts) "
+    "VALUES ('rebuild')",
+)
+SQLITE_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_update',
+    'DROP TABLE IF EXISTS recipes_ingredient_fts',
+)
+
+
+def run_for_vendor(postgresql, sqlite):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgresql,
+            'sqlite': sqlite,
+        }.get(schema_editor.connection.vendor, ())
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_catalogueversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
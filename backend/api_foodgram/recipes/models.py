@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.core.validators import RegexValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, router, transaction
 
-from users.models import CustomUser
+from users.models import (CounterFieldsMixin, CounterQuerySetMixin, CustomUser,
+                          Subscription)
 
 MIN_COOKING_TIME = 1
+TIMELINE_BATCH_SIZE = 1000
+UPSERT_BATCH_SIZE = 200
+POPULAR_ORDERING = ('-favorites_count', '-in_carts_count', '-pub_date', '-id')
 
 
 class Tag(models.Model):
@@ -51,7 +56,82 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class CatalogueVersion(models.Model):
+    label = models.CharField(
+        primary_key=True,
+        max_length=100,
+        verbose_name='Модель',
+    )
+    version = models.BigIntegerField(
+        verbose_name='Версия',
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.label} {self.version}'
+
+
+class RecipeQuerySet(CounterQuerySetMixin, models.QuerySet):
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+    def with_author(self, user):
+        return self.prefetch_related(models.Prefetch(
+            'author',
+            queryset=CustomUser.objects.with_is_subscribed(user),
+        ))
+
+    # Tags and ingredients are not loaded here: a page of recipes gets them
+    # from attach_read_rows(), otherwise the serializer reads them per recipe.
+    def for_read(self, user):
+        return self.with_user_flags(user).with_author(user)
+
+    def latest_per_author(self, limit):
+        if limit is None:
+            return self
+        return self.filter(pk__in=models.Subquery(
+            self.model.objects.filter(
+                author=models.OuterRef('author')
+            ).order_by('-pub_date').values('pk')[:limit]
+        ))
+
+
+def attach_read_rows(recipes):
+    # Tags and ingredients of a page are read in two queries as plain rows,
+    # without building model instances, and serialized from tag_rows and
+    # ingredient_rows.
+    tag_rows, ingredient_rows = {}, {}
+    recipe_ids = {recipe.pk for recipe in recipes}
+    if recipe_ids:
+        for recipe_id, *row in Tag.objects.filter(
+            recipes__in=recipe_ids
+        ).values_list('recipes', 'id', 'name', 'color', 'slug'):
+            tag_rows.setdefault(recipe_id, []).append(row)
+        for recipe_id, *row in RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id', 'ingredient__name',
+                      'ingredient__measurement_unit', 'amount'):
+            ingredient_rows.setdefault(recipe_id, []).append(row)
+    for recipe in recipes:
+        recipe.tag_rows = tag_rows.get(recipe.pk, [])
+        recipe.ingredient_rows = ingredient_rows.get(recipe.pk, [])
+    return recipes
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -70,6 +150,11 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Картинка',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии картинки',
+    )
     text = models.TextField(
         verbose_name='Описание рецепта'
     )
@@ -87,15 +172,47 @@ class Recipe(models.Model):
         verbose_name='Время приготовления в минутах',
         validators=[MinValueValidator(MIN_COOKING_TIME)]
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В корзинах',
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=list(POPULAR_ORDERING),
+                name='recipe_popular_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def get_ingredient_amounts(self):
+        return dict(
+            self.recipe_ingredients.values_list('ingredient_id')
+            .annotate(total=models.Sum('amount'))
+            .order_by()
+        )
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -115,6 +232,12 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe_id} {self.ingredient_id}'
@@ -166,6 +289,213 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.recipe_id}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    def add_recipe(self, user_ids, amounts):
+        # A single INSERT ... ON CONFLICT DO UPDATE either creates the row or
+        # adds to it, so a removal that deletes the row concurrently cannot
+        # make the addition miss it.
+        rows = [
+            (user_id, ingredient_id, amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+        ]
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {table} '
+                    f'(user_id, ingredient_id, amount, recipes_count) '
+                    f'VALUES {", ".join(["(%s, %s, %s, 1)"] * len(batch))} '
+                    f'ON CONFLICT (user_id, ingredient_id) DO UPDATE SET '
+                    f'amount = {table}.amount + EXCLUDED.amount, '
+                    f'recipes_count = {table}.recipes_count + 1',
+                    [value for row in batch for value in row])
+
+    def remove_recipe(self, user_ids, amounts):
+        if not user_ids or not amounts:
+            return
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            items.update(
+                amount=models.F('amount') - models.Case(
+                    *[models.When(ingredient_id=ingredient_id,
+                                  then=models.Value(amount))
+                      for ingredient_id, amount in amounts.items()],
+                    output_field=models.FloatField(),
+                ),
+                recipes_count=models.F('recipes_count') - 1,
+            )
+            # A row that an addition has already bumped again keeps a
+            # positive count and survives.
+            items.filter(recipes_count__lte=0).delete()
+
+    def cart_totals(self):
+        return (
+            RecipeIngredient.objects
+            .filter(recipe__shopping_cart_recipe__isnull=False)
+            .values('ingredient_id',
+                    user_id=models.F('recipe__shopping_cart_recipe__user'))
+            .annotate(total=models.Sum('amount'),
+                      recipes=models.Count('recipe', distinct=True))
+            .order_by()
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.FloatField(
+        verbose_name='Количество',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов в корзине',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.ingredient_id}'
+
+
+def get_followers_count(author_id):
+    return CustomUser.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True).first()
+
+
+def fans_out(author_id):
+    followers_count = get_followers_count(author_id)
+    return (followers_count is not None
+            and followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS)
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def publish(self, recipe):
+        if fans_out(recipe.author_id):
+            self._fill(
+                Subscription.objects.filter(subscribe=recipe.author_id)
+                .values_list('user', flat=True),
+                [(recipe.pk, recipe.pub_date)],
+            )
+
+    def follow(self, user_id, author_id):
+        if fans_out(author_id):
+            self._fill([user_id], self._recipes_of(author_id))
+        else:
+            self.filter(recipe__author=author_id).delete()
+
+    def unfollow(self, user_id, author_id):
+        self.filter(user=user_id, recipe__author=author_id).delete()
+        if (get_followers_count(author_id)
+                == settings.FEED_FANOUT_MAX_FOLLOWERS):
+            self._fill(
+                Subscription.objects.filter(subscribe=author_id)
+                .values_list('user', flat=True),
+                self._recipes_of(author_id),
+            )
+
+    def _recipes_of(self, author_id):
+        return list(Recipe.objects.filter(author=author_id).order_by()
+                    .values_list('pk', 'pub_date'))
+
+    def _fill(self, user_ids, recipes):
+        if not recipes:
+            return
+        self.bulk_create(
+            [self.model(user_id=user_id, recipe_id=recipe_id,
+                        pub_date=pub_date)
+             for user_id in user_ids
+             for recipe_id, pub_date in recipes],
+            batch_size=TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def expected_entries(self):
+        return Recipe.objects.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+            author__subscribe__isnull=False,
+        ).order_by().values_list('author__subscribe__user', 'pk', 'pub_date')
+
+    def feed_sources(self, user):
+        sources = [(self.filter(user=user), ('pub_date', 'recipe'))]
+        popular = list(Subscription.objects.filter(
+            user=user,
+            subscribe__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list('subscribe', flat=True))
+        if popular:
+            sources.append((
+                Recipe.objects.filter(author__in=popular), ('pub_date', 'id')))
+        return sources
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user_id} {self.recipe_id}'
@@ -0,0 +1,120 @@
+from django.db import connections
+from django.db.models import BooleanField, Count, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce
+
+from recipes.models import Ingredient, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+INGREDIENT_FTS_TABLE = 'recipes_ingredient_fts'
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+
+def search_recipes(queryset, query):
+    words = query.lower().split()
+    if not words:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        return _search_postgresql(queryset, query)
+    return _search_sqlite(queryset, words)
+
+
+def _search_postgresql(queryset, query):
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    ingredients = Ingredient.objects.filter(RawSQL(
+        f"to_tsvector('{SEARCH_CONFIG}', recipes_ingredient.name) "
+        f"@@ {tsquery}",
+        [query], output_field=BooleanField(),
+    ))
+    return queryset.annotate(
+        search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+            [query], output_field=FloatField(),
+        ),
+    ).filter(
+        Q(RawSQL(f'recipes_recipe.search_vector @@ {tsquery}',
+                 [query], output_field=BooleanField()))
+        | Q(pk__in=RecipeIngredient.objects.filter(
+            ingredient__in=ingredients).values('recipe'))
+    ).order_by('-search_rank', '-pub_date')
+
+
+def _search_sqlite(queryset, words):
+    match = ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in words)
+    ingredients = RawSQL(
+        f'SELECT rowid FROM {INGREDIENT_FTS_TABLE} '
+        f'WHERE {INGREDIENT_FTS_TABLE} MATCH %s',
+        [match])
+    return queryset.annotate(
+        search_rank=Coalesce(RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {NAME_WEIGHT}, {TEXT_WEIGHT}) '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = recipes_recipe.id',
+            [match], output_field=FloatField(),
+        ), 0.0),
+    ).filter(
+        Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match]))
+        | Q(pk__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredients).values('recipe'))
+    ).order_by('-search_rank', '-pub_date')
+
+
+def rank_by_ingredient_coverage(ingredient_ids, limit):
+    return (
+        RecipeIngredient.objects
+        .filter(recipe__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids).values('recipe'))
+        .values('recipe')
+        .annotate(
+            matched=Count('pk', filter=Q(ingredient_id__in=ingredient_ids)),
+            total=Count('pk'),
+        )
+        .annotate(coverage=Cast(F('matched'), FloatField())
+                  / Cast(F('total'), FloatField()))
+        .order_by('-coverage', '-matched', '-recipe')[:limit]
+    )
+
+
+def _fts_connection(using):
+    connection = connections[using or 'default']
+    if connection.vendor == 'sqlite':
+        return connection
+    return None
+
+
+def index_recipe(sender, instance, using=None, **kwargs):
+    connection = _fts_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            [instance.pk, instance.name, instance.text])
+
+
+def unindex_recipe(sender, instance, using=None, **kwargs):
+    connection = _fts_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+
+
+def reindex_recipes(using=None):
+    connection = _fts_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'SELECT id, name, text FROM recipes_recipe')
@@ -0,0 +1,165 @@
+import os
+import tempfile
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from recipes.catalogue import get_version
+from recipes.management.commands.load_catalogue import (
+    Command as LoadCatalogueCommand)
+from recipes.models import (CatalogueVersion, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from recipes.search import search_recipes
+from recipes.storage import ContentAddressedStorage
+
+User = get_user_model()
+
+
+@override_settings(CATALOGUE_VERSION_TTL=0)
+class CatalogueVersionTest(TestCase):
+    def test_save_bumps_version(self):
+        version = get_version(Tag)
+        Tag.objects.create(name='завтрак', color='#E26C2D', slug='breakfast')
+        self.assertGreater(get_version(Tag), version)
+
+    def test_version_is_read_from_the_database(self):
+        version = get_version(Tag)
+        # A bump made by another worker process.
+        CatalogueVersion.objects.filter(label='recipes.tag').update(
+            version=F('version') + 1)
+        self.assertEqual(get_version(Tag), version + 1)
+
+
+class RecipeIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Author', last_name='Author')
+        Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'recipe{index}', text='text',
+                   image='recipes/test.jpg', cooking_time=10)
+            for index in range(20))
+
+    def assert_uses_index(self, queryset, index):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, keep the planner off seq scans.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn(index, queryset.explain())
+
+    def test_default_list_uses_pub_date_index(self):
+        queryset = Recipe.objects.for_read(AnonymousUser())
+        self.assert_uses_index(queryset[:6], 'recipe_pub_date_idx')
+        self.assert_uses_index(
+            queryset.order_by('-pub_date', '-id')[:6], 'recipe_pub_date_idx')
+
+    def test_author_list_uses_author_index(self):
+        queryset = Recipe.objects.for_read(AnonymousUser()).filter(
+            author=self.author)
+        self.assert_uses_index(queryset[:6], 'recipe_author_pub_date_idx')
+
+
+class RecipeSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='chef', email='chef@example.com',
+            first_name='Chef', last_name='Chef')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Сметана', measurement_unit='г'),
+            Ingredient(name='Мука пшеничная', measurement_unit='г'),
+        ])
+        cls.recipes = {}
+        for key, name, text, ingredient in (
+            ('name', 'Блины со сметаной', 'Жарим на сковороде', None),
+            ('text', 'Омлет', 'Подаём вместе с блинами', None),
+            ('ingredient', 'Оладьи', 'Жарим на масле', 'Мука пшеничная'),
+            ('other', 'Салат', 'Нарезаем овощи', 'Сметана'),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text=text,
+                image='recipes/test.jpg', cooking_time=10)
+            if ingredient:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, amount=100,
+                    ingredient=Ingredient.objects.get(name=ingredient))
+            cls.recipes[key] = recipe
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query))
+
+    def assert_finds(self, query, *keys):
+        self.assertEqual(
+            self.search(query), [self.recipes[key] for key in keys])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 fallback')
+    def test_sqlite_matches_words_by_prefix(self):
+        # A name match ranks above a match in the text.
+        self.assert_finds('блин', 'name', 'text')
+        self.assert_finds('мук', 'ingredient')
+        # Words are matched from the start, not as substrings.
+        self.assert_finds('шеничн')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 fallback')
+    def test_sqlite_ingredient_index_follows_changes(self):
+        ingredient = Ingredient.objects.get(name='Мука пшеничная')
+        ingredient.name = 'Крахмал'
+        ingredient.save()
+        self.assert_finds('мук')
+        self.assert_finds('крахмал', 'ingredient')
+        ingredient.delete()
+        self.assert_finds('крахмал')
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search')
+    def test_postgresql_matches_word_forms(self):
+        # The Russian configuration reduces words to their stems.
+        self.assert_finds('блины', 'name', 'text')
+        self.assert_finds('муки', 'ingredient')
+        self.assert_finds('сметаны', 'name', 'other')
+        self.assert_finds('блины -омлет', 'name')
+
+    def test_empty_query_returns_everything(self):
+        self.assertEqual(len(self.search('  ')), len(self.recipes))
+
+
+class LoadCatalogueTest(TestCase):
+    def test_conflicting_rows_are_not_counted_as_inserted(self):
+        # A row added by someone else after the command read the table.
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        command = LoadCatalogueCommand()
+        command.loaded = set()
+        command.inserted = command.skipped = 0
+        command.insert(Ingredient, [
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'перец', 'measurement_unit': 'г'},
+        ])
+        self.assertEqual((command.inserted, command.skipped), (1, 1))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('recipes/a.JPG', ContentFile(b'image'))
+        second = self.storage.save('recipes/b.jpg', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.jpg'))
+
+    def test_reuse_refreshes_modified_time(self):
+        name = self.storage.save('recipes/a.jpg', ContentFile(b'image'))
+        day_ago = time.time() - 24 * 60 * 60
+        os.utime(self.storage.path(name), (day_ago, day_ago))
+        self.storage.save('recipes/b.jpg', ContentFile(b'image'))
+        self.assertGreater(
+            os.path.getmtime(self.storage.path(name)), day_ago + 60)
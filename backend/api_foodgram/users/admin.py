@@ -13,9 +13,12 @@ class AdminCustomUser(admin.ModelAdmin):
                     'password',
                     'email',
                     'first_name',
-                    'last_name'
+                    'last_name',
+                    'followers_count',
+                    'recipes_count',
                     )
     list_filter = ('username', 'email',)
+    readonly_fields = ('followers_count', 'recipes_count')
 
 
 @admin.register(Subscription)
@@ -1,8 +1,47 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 
-class CustomUser(AbstractUser):
+class CounterQuerySetMixin:
+    def bump_counter(self, field, delta):
+        queryset = self
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        return queryset.update(**{field: models.F(field) + delta})
+
+
+class CounterFieldsMixin:
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        # Counters are only changed by bump_counter, so a full save of an
+        # instance loaded earlier must not write their stale values back.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUserQuerySet(CounterQuerySetMixin, models.QuerySet):
+    def with_is_subscribed(self, user):
+        if not user.is_authenticated:
+            return self.annotate(is_subscribed=models.Value(False))
+        return self.annotate(is_subscribed=models.Exists(
+            Subscription.objects.filter(
+                user=user, subscribe=models.OuterRef('pk'))))
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
 
     username = models.CharField(
         max_length=150,
@@ -18,13 +57,30 @@ class CustomUser(AbstractUser):
     last_name = models.CharField(
         max_length=150,
     )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name']
 
+    objects = CustomUserManager()
+    counter_fields = ('followers_count', 'recipes_count')
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['-followers_count'],
+                name='user_followers_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.username
@@ -0,0 +1,299 @@
+import argparse
+import http.client
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+SLOW_CLIENT_INTERVAL = 1
+PAGE_SIZE = 6
+PAGE_SKEW = 1.2
+TAG_FILTER_SHARE = 0.3
+DEFAULT_MIX = {
+    'recipes': 40,
+    'recipe': 25,
+    'feed': 10,
+    'subscriptions': 10,
+    'shopping_cart': 5,
+    'favorite': 10,
+    'cart': 10,
+}
+QUERIES_SAMPLE = re.compile(
+    r'^foodgram_db_queries_per_request_(sum|count)\{(.*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(round(share * (len(values) - 1))))
+    return values[index]
+
+
+def hold_slow_client(host, port, path, stop):
+    sock = socket.create_connection((host, port))
+    try:
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'.encode())
+        while not stop.wait(SLOW_CLIENT_INTERVAL):
+            sock.sendall(b'X-Slow: 1\r\n')
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def fetch(name, path):
+    yield f'{name} GET', 'GET', path
+
+
+def toggle(name, path):
+    status = yield f'{name} POST', 'POST', path
+    yield f'{name} DELETE', 'DELETE', path
+    if status == 304:
+        yield f'{name} POST', 'POST', path
+
+
+def recipes_page(rng, dataset):
+    pages = max(1, len(dataset['recipes']) // PAGE_SIZE)
+    page = min(int(rng.paretovariate(PAGE_SKEW)), pages)
+    path = f'/api/recipes/?page={page}&limit={PAGE_SIZE}'
+    if rng.random() < TAG_FILTER_SHARE:
+        path += f'&tags={rng.choice(dataset["tags"])}'
+    return fetch('recipes', path)
+
+
+def recipe_detail(rng, dataset):
+    return fetch('recipe', f'/api/recipes/{rng.choice(dataset["recipes"])}/')
+
+
+def feed(rng, dataset):
+    return fetch('feed', f'/api/recipes/feed/?limit={PAGE_SIZE}')
+
+
+def subscriptions(rng, dataset):
+    return fetch('subscriptions', f'/api/users/subscriptions/'
+                                  f'?limit={PAGE_SIZE}&recipes_limit=3')
+
+
+def download_shopping_cart(rng, dataset):
+    return fetch('shopping_cart', '/api/recipes/download_shopping_cart/')
+
+
+def toggle_favorite(rng, dataset):
+    return toggle(
+        'favorite', f'/api/recipes/{rng.choice(dataset["recipes"])}/favorite/')
+
+
+def toggle_cart(rng, dataset):
+    return toggle(
+        'cart',
+        f'/api/recipes/{rng.choice(dataset["recipes"])}/shopping_cart/')
+
+
+SCENARIOS = {
+    'recipes': recipes_page,
+    'recipe': recipe_detail,
+    'feed': feed,
+    'subscriptions': subscriptions,
+    'shopping_cart': download_shopping_cart,
+    'favorite': toggle_favorite,
+    'cart': toggle_cart,
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(
+                f'неизвестный сценарий {name}, доступны: '
+                f'{", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def mixed_scenarios(rng, dataset, mix):
+    names = list(mix)
+    weights = list(itertools.accumulate(mix.values()))
+    while True:
+        name = rng.choices(names, cum_weights=weights)[0]
+        yield SCENARIOS[name](rng, dataset)
+
+
+def cycled_paths(paths):
+    for path in itertools.cycle(paths):
+        yield fetch(path, path)
+
+
+def run_client(host, port, scenarios, headers, deadline, stats, lock):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while time.monotonic() < deadline:
+        scenario, status = next(scenarios), None
+        while True:
+            try:
+                label, method, path = scenario.send(status)
+            except StopIteration:
+                break
+            started = time.monotonic()
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(
+                    host, port, timeout=30)
+                status = None
+            elapsed = time.monotonic() - started
+            with lock:
+                if status is None or status >= 400:
+                    stats[label][1] += 1
+                else:
+                    stats[label][0].append(elapsed)
+    connection.close()
+
+
+def query_totals(host, port):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request('GET', '/api/metrics')
+        response = connection.getresponse()
+        body = response.read().decode()
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+    if response.status != 200:
+        return None
+    totals = defaultdict(lambda: [0, 0])
+    for line in body.splitlines():
+        match = QUERIES_SAMPLE.match(line)
+        if match:
+            kind, labels, value = match.groups()
+            labels = dict(LABEL.findall(labels))
+            key = labels.get('view'), labels.get('method')
+            totals[key][kind == 'count'] += float(value)
+    return totals
+
+
+def report(stats, elapsed):
+    rows = sorted(stats.items())
+    total_latencies = sorted(
+        itertools.chain.from_iterable(latencies for latencies, _ in
+                                      stats.values()))
+    rows.append(('всего', [total_latencies,
+                           sum(errors for _, errors in stats.values())]))
+    print(f'{"сценарий":<24} {"запросов":>9} {"ошибок":>7} {"req/s":>8} '
+          f'{"p50, ms":>8} {"p95, ms":>8} {"p99, ms":>8}')
+    for label, (latencies, errors) in rows:
+        latencies.sort()
+        print(f'{label:<24} {len(latencies):>9} {errors:>7} '
+              f'{len(latencies) / elapsed:>8.1f} '
+              + ' '.join(f'{percentile(latencies, share) * 1000:>8.1f}'
+                         for share in (0.5, 0.95, 0.99)))
+
+
+def report_queries(before, after):
+    print(f'\n{"представление":<40} {"запросов":>9} {"SQL на запрос":>14}')
+    for key, (total, count) in sorted(after.items()):
+        previous_total, previous_count = before.get(key, (0, 0))
+        count -= previous_count
+        if count:
+            view, method = key
+            print(f'{view + " " + method:<40} {count:>9.0f} '
+                  f'{(total - previous_total) / count:>14.1f}')
+
+
+def client_scenarios(options, dataset, headers, index):
+    if dataset is None:
+        shift = index % len(options.paths)
+        return cycled_paths(
+            options.paths[shift:] + options.paths[:shift]), headers
+    rng = random.Random(f'{options.seed}:{index}')
+    token = dataset['tokens'][index % len(dataset['tokens'])]
+    return (mixed_scenarios(rng, dataset, options.mix),
+            dict(headers, Authorization=f'Token {token}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный прогон запросов к API.')
+    parser.add_argument('base_url', help='Например, http://localhost:8000')
+    parser.add_argument(
+        'paths', nargs='*',
+        help='Пути для GET-запросов, например /api/tags/. '
+             'Не нужны, если указан --dataset.')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='Сколько медленных клиентов держать открытыми.')
+    parser.add_argument('--token', help='Токен для заголовка Authorization.')
+    parser.add_argument(
+        '--dataset',
+        help='Манифест generate_dataset: запросы идут по смеси сценариев '
+             'от имени пользователей набора.')
+    parser.add_argument(
+        '--mix', type=parse_mix, default=DEFAULT_MIX,
+        help='Веса сценариев, например recipes=40,recipe=25,favorite=10. '
+             f'Доступны: {", ".join(SCENARIOS)}.')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+    if not options.paths and not options.dataset:
+        parser.error('укажите пути или --dataset')
+
+    url = urlsplit(options.base_url)
+    host, port = url.hostname, url.port or 80
+    headers = {'Accept': 'application/json'}
+    if options.token:
+        headers['Authorization'] = f'Token {options.token}'
+    dataset = None
+    if options.dataset:
+        with open(options.dataset, encoding='utf-8') as file:
+            dataset = json.load(file)
+
+    stop = threading.Event()
+    slow_path = options.paths[0] if options.paths else '/api/recipes/'
+    slow_clients = [
+        threading.Thread(target=hold_slow_client,
+                         args=(host, port, slow_path, stop))
+        for _ in range(options.slow_clients)
+    ]
+    for thread in slow_clients:
+        thread.start()
+
+    stats, lock = defaultdict(lambda: [[], 0]), threading.Lock()
+    deadline = time.monotonic() + options.duration
+    clients = [
+        threading.Thread(target=run_client, args=(
+            host, port, *client_scenarios(options, dataset, headers, index),
+            deadline, stats, lock))
+        for index in range(options.concurrency)
+    ]
+    queries_before = query_totals(host, port)
+    started = time.monotonic()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.monotonic() - started
+    stop.set()
+    for thread in slow_clients:
+        thread.join()
+
+    report(stats, elapsed)
+    queries_after = query_totals(host, port)
+    if queries_before is None or queries_after is None:
+        print('\n/api/metrics недоступен: число SQL-запросов не посчитано.')
+    else:
+        report_queries(queries_before, queries_after)
+
+
+if __name__ == '__main__':
+    main()